@@ -8,24 +8,48 @@ import os
 load_dotenv()
 
 # Import after .env is loaded
-from models import create_tables
+import db
+import metrics
+import pagination
+import json_provider
+import compression
+from migrations import check_schema
 from routes.auth_routes import auth_bp
 from routes.course_routes import course_bp
 from routes.quiz_routes import quiz_bp
 from routes.comment_routes import comment_bp
+from routes.admin_routes import admin_bp
 
 app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'secret123')  # fallback if not set
-CORS(app)
+# Signs login tokens (tokens.py). No fallback: anyone who knows a default
+# key could mint admin tokens.
+app.secret_key = os.getenv('SECRET_KEY')
+if not app.secret_key:
+    raise RuntimeError("SECRET_KEY is not set; generate one with "
+                       "python -c 'import secrets; print(secrets.token_hex(32))'")
+CORS(app, expose_headers=["X-Next-Cursor", "Link"])
 
-# Create tables (currently for SQLite, update when PostgreSQL is wired)
-create_tables()
+# Pooled, request-scoped database connections
+db.init_app(app)
+pagination.init_app(app)
+
+# Route/query instrumentation and GET /metrics; registered before the other
+# after_request hooks so its timings include them
+metrics.init_app(app)
+
+# orjson-backed JSON and gzip/brotli for large responses
+json_provider.init_app(app)
+compression.init_app(app)
+
+# Fail fast if `python migrations.py` has not been run for this release
+check_schema()
 
 # Register blueprints
 app.register_blueprint(comment_bp)
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(course_bp)
 app.register_blueprint(quiz_bp)
+app.register_blueprint(admin_bp)
 
 @app.route('/')
 def home():
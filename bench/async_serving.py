@@ -0,0 +1,198 @@
+# backend/bench/async_serving.py
+#
+# Side-by-side throughput of SERVER_MODE=sync and SERVER_MODE=async (see
+# gunicorn.conf.py) against a local Postgres reached through a TCP proxy
+# that adds a simulated network round trip:
+#
+#     python migrations.py
+#     python bench/async_serving.py --rtt-ms 0 20 50 --concurrency 50
+#
+# Each mode is started as a real gunicorn process with the same worker
+# count; the proxy delays every packet by half the RTT in each direction.
+# Requests go to routes that hit the database on every call.
+
+import argparse
+import http.client
+import os
+import queue
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from db import DB_HOST, DB_PORT
+
+DEFAULT_PATHS = ["/comments/1", "/auth/leaderboard", "/auth/user-attempts/bench_user"]
+
+
+class LatencyProxy:
+    # Forwards 127.0.0.1:<port> to Postgres, holding each chunk for delay
+    # seconds before passing it on. Chunks are queued rather than slept on,
+    # so pipelined traffic is delayed, not serialized.
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(256)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _upstream(self):
+        if DB_HOST.startswith("/"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(os.path.join(DB_HOST, f".s.PGSQL.{DB_PORT}"))
+        else:
+            sock = socket.create_connection((DB_HOST, int(DB_PORT)))
+        return sock
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            server = self._upstream()
+            for src, dst in ((client, server), (server, client)):
+                pending = queue.Queue()
+                threading.Thread(target=self._read, args=(src, pending), daemon=True).start()
+                threading.Thread(target=self._write, args=(dst, pending), daemon=True).start()
+
+    def _read(self, src, pending):
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b""
+            pending.put((time.monotonic() + self.delay, data))
+            if not data:
+                return
+
+    def _write(self, dst, pending):
+        while True:
+            deliver_at, data = pending.get()
+            wait = deliver_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if not data:
+                try:
+                    dst.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                return
+            try:
+                dst.sendall(data)
+            except OSError:
+                return
+
+
+def start_server(mode, port, proxy_port, args):
+    env = dict(os.environ,
+               SERVER_MODE=mode,
+               DB_HOST="127.0.0.1",
+               DB_PORT=str(proxy_port),
+               DB_POOL_MAX=str(args.pool_max))
+    proc = subprocess.Popen(
+        ["gunicorn", "app:app", "-b", f"127.0.0.1:{port}", "-w", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            request(port, "/courses")
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def request(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def drive(port, paths, concurrency, duration):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(n):
+        i = n
+        while time.monotonic() < stop_at:
+            started = time.monotonic()
+            try:
+                ok = request(port, paths[i % len(paths)]) < 500
+            except OSError:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.monotonic() - started)
+                else:
+                    errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, nargs="+", default=[0, 20, 50])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per measurement")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--pool-max", type=int, default=20, help="DB_POOL_MAX for each worker")
+    parser.add_argument("--path", action="append", dest="paths", help="route to request (repeatable)")
+    args = parser.parse_args()
+    paths = args.paths or DEFAULT_PATHS
+
+    print(f"{'mode':<8}{'rtt ms':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for rtt in args.rtt_ms:
+        proxy = LatencyProxy(rtt / 2000)
+        for mode in ("sync", "async"):
+            port = free_port()
+            proc = start_server(mode, port, proxy.port, args)
+            try:
+                drive(port, paths, args.concurrency, 1)  # warm the pools
+                latencies, errors = drive(port, paths, args.concurrency, args.duration)
+            finally:
+                stop_server(proc)
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1e3 if latencies else float("nan")
+            p95 = latencies[int(len(latencies) * 0.95)] * 1e3 if latencies else float("nan")
+            print(f"{mode:<8}{rtt:>8g}{len(latencies) / args.duration:>10.1f}{p50:>10.1f}{p95:>10.1f}{errors:>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
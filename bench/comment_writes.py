@@ -0,0 +1,122 @@
+# backend/bench/comment_writes.py
+#
+# POST /comments throughput: the per-request INSERT + COMMIT path versus the
+# group-commit writer (COMMENT_WRITES=batched, see comment_writer.py). Run
+# against a scratch database:
+#
+#     DB_HOST=localhost DB_NAME=fcc_bench python migrations.py
+#     DB_HOST=localhost DB_NAME=fcc_bench python bench/comment_writes.py --threads 32
+#
+# Requests go through the Flask app in-process, one thread per concurrent
+# poster, so both paths pay the same routing and JSON costs; what differs is
+# how many transactions (and fsyncs) the comments are committed in. Works on
+# either backend (DB_BACKEND=sqlite too). The bench lesson and its comments
+# are deleted afterwards.
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import comment_writer
+from app import app
+from db import connection
+
+
+def setup():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO courses (title, description) VALUES (%s, %s) RETURNING id",
+                       ("bench comments", "temporary"))
+        course_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO lessons (course_id, title) VALUES (%s, %s) RETURNING id",
+                       (course_id, "bench comments"))
+        lesson_id = cursor.fetchone()[0]
+        conn.commit()
+    return course_id, lesson_id
+
+
+def teardown(course_id, lesson_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM comments WHERE lesson_id = %s", (lesson_id,))
+        cursor.execute("DELETE FROM lessons WHERE id = %s", (lesson_id,))
+        cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+        conn.commit()
+
+
+def run(lesson_id, threads, per_thread):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def poster(index):
+        client = app.test_client()
+        mine = []
+        start.wait()
+        for n in range(per_thread):
+            began = time.perf_counter()
+            response = client.post("/comments", json={
+                "lesson_id": lesson_id, "username": f"bench_{index}", "text": f"comment {n}",
+            })
+            mine.append(time.perf_counter() - began)
+            if response.status_code != 201:
+                with lock:
+                    errors.append(response.status_code)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=poster, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - began, latencies, errors
+
+
+def count_comments(lesson_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM comments WHERE lesson_id = %s", (lesson_id,))
+        count = cursor.fetchone()[0]
+        conn.rollback()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16, help="concurrent posters")
+    parser.add_argument("--per-thread", type=int, default=200, help="comments per poster")
+    parser.add_argument("--batch-size", type=int, default=comment_writer.BATCH_SIZE)
+    parser.add_argument("--batch-wait-ms", type=float, default=comment_writer.BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    course_id, lesson_id = setup()
+    total = args.threads * args.per_thread
+    try:
+        for label, batched in (("direct", False), ("batched", True)):
+            comment_writer.BATCHED = batched
+            comment_writer.writer = comment_writer.CommentWriter(args.batch_size, args.batch_wait_ms)
+            before = count_comments(lesson_id)
+            elapsed, latencies, errors = run(lesson_id, args.threads, args.per_thread)
+            comment_writer.writer.drain()
+            stored = count_comments(lesson_id) - before
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{label:>8}: {total / elapsed:8.0f} inserts/s  "
+                  f"p50={statistics.median(latencies) * 1000:6.2f}ms  p95={p95 * 1000:6.2f}ms  "
+                  f"errors={len(errors)}  stored={stored}/{total}")
+    finally:
+        teardown(course_id, lesson_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# backend/bench/explain_check.py
+#
+# Query-plan regression check for the hot route queries. Runs EXPLAIN on
+# each statement below and fails if any plan falls back to a sequential
+# scan of a table larger than --max-seq-rows (by pg_class.reltuples).
+#
+#     python migrations.py
+#     python bench/generate_dataset.py ...    # or any realistically sized copy
+#     python bench/explain_check.py --max-seq-rows 10000
+#
+# Exit status is 1 when a query regresses, so it can gate CI. Statements
+# kept in modules (e.g. grading.ATTEMPT_UPSERT) are imported, so they cannot
+# drift; route SQL written inline in routes/ is copied below and must be
+# kept in sync when a route's query shape changes.
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from grading import ATTEMPT_UPSERT
+
+# (route, sql, params)
+QUERIES = [
+    ("GET /quiz/<lesson_id>", """
+        SELECT q.id, q.question_text, a.id, a.answer_text
+        FROM questions q
+        LEFT JOIN answers a ON a.question_id = q.id
+        WHERE q.lesson_id = %s
+        ORDER BY q.id, a.id
+    """, (1,)),
+    ("GET /questions/<id>/answers",
+     "SELECT id, answer_text FROM answers WHERE question_id = %s", (1,)),
+    ("GET /courses/<id>/lessons",
+     "SELECT id, id, title, video_url FROM lessons WHERE course_id = %s AND id > %s ORDER BY id LIMIT %s",
+     (1, 0, 101)),
+    ("GET /comments/<lesson_id>", """
+        SELECT id, username, text, timestamp FROM comments
+        WHERE lesson_id = %s AND (timestamp, id) < (%s::timestamptz, %s)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s
+    """, (1, "infinity", 0, 101)),
+    ("GET /user-progress/<username>", """
+        SELECT ua.question_id, ua.attempts, ua.is_correct, l.title
+        FROM user_attempts ua
+        JOIN questions q ON ua.question_id = q.id
+        JOIN lessons l ON q.lesson_id = l.id
+        WHERE ua.user_id = %s AND ua.question_id > %s
+        ORDER BY ua.question_id
+        LIMIT %s
+    """, (1, 0, 101)),
+    ("GET /auth/user-attempts/<username>", """
+        SELECT question_id, attempts, is_correct FROM user_attempts
+        WHERE user_id = %s AND question_id > %s
+        ORDER BY question_id LIMIT %s
+    """, (1, 0, 101)),
+    ("user lookup by username",
+     "SELECT id FROM users WHERE username = %s", ("someone",)),
+    ("grade_answer: attempt upsert", ATTEMPT_UPSERT, (1, 1, True)),
+    ("GET /auth/leaderboard", """
+        SELECT id, username, total_points FROM users
+        ORDER BY total_points DESC, id
+        LIMIT %s OFFSET %s
+    """, (50, 0)),
+    ("GET /auth/leaderboard/rank/<username>", """
+        SELECT COALESCE(SUM(s.user_count), 0) FROM leaderboard_scores s
+        WHERE s.total_points > %s
+    """, (100,)),
+    ("GET /auth/leaderboard?window=week", """
+        SELECT s.user_id, s.points FROM leaderboard_windows s
+        WHERE s.period = %s AND s.bucket_start = %s AND s.course_id = %s AND s.points > 0
+        ORDER BY s.points DESC, s.user_id
+        LIMIT %s OFFSET %s
+    """, ("week", "2024-01-01", 0, 50, 0)),
+    ("GET /auth/leaderboard?course_id=<id>", """
+        SELECT s.user_id, s.points FROM course_progress s
+        WHERE s.course_id = %s AND s.points > 0
+        ORDER BY s.points DESC, s.user_id
+        LIMIT %s OFFSET %s
+    """, (1, 50, 0)),
+    ("DELETE /questions/<id>/delete",
+     "DELETE FROM user_attempts WHERE question_id = %s", (1,)),
+    ("DELETE /lessons/<id>: comments",
+     "DELETE FROM comments WHERE lesson_id = %s", (1,)),
+    ("DELETE /lessons/<id>: progress",
+     "DELETE FROM user_progress WHERE lesson_id = %s", (1,)),
+    ("DELETE /lessons/<id>: points",
+     "DELETE FROM user_points WHERE lesson_id = %s", (1,)),
+]
+
+
+def seq_scans(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-seq-rows", type=int, default=int(os.getenv("EXPLAIN_MAX_SEQ_ROWS", "10000")),
+                        help="tables larger than this must not be sequentially scanned")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+    cursor = conn.cursor()
+    failures = 0
+
+    for route, sql, params in QUERIES:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]["Plan"]
+
+        offenders = []
+        for table in sorted(set(seq_scans(plan))):
+            cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE relname = %s", (table,))
+            rows = max(cursor.fetchone()[0], 0)
+            if rows > args.max_seq_rows:
+                offenders.append(f"{table} (~{rows} rows)")
+
+        status = "FAIL" if offenders else "ok"
+        detail = f"  seq scan on {', '.join(offenders)}" if offenders else ""
+        print(f"[{status:>4}] {route}{detail}")
+        failures += bool(offenders)
+
+    # EXPLAIN of DELETE plans nothing destructive, but never leave a transaction open
+    conn.rollback()
+    conn.close()
+
+    if failures:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} regressed to a sequential scan", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+# backend/bench/generate_dataset.py
+#
+# Fills the database with a large synthetic dataset for scale testing,
+# loading every table with COPY:
+#
+#     python bench/generate_dataset.py                  # small default volumes
+#     python bench/generate_dataset.py --preset large   # 1M users, 10k lessons,
+#                                                       # 100k questions, 50M attempts
+#     python bench/generate_dataset.py --users 200000 --attempts 5000000
+#
+# The schema comes from models.create_tables(). Rows are appended after the
+# current max ids, so it can run on a database that already holds data.
+# Lesson traffic follows a Zipf curve (a few hot lessons get most of the
+# attempts and comments). User activity is Pareto distributed, and
+# total_points is computed from the attempts with grade_answer's scoring,
+# so points are power-law too, and the progress rollups are rebuilt for the
+# new users (see progress.py). Postgres only.
+
+import argparse
+import bisect
+import datetime
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import DIALECT, connection
+from grading import POINTS_BY_ATTEMPT
+from models import create_tables
+from progress import backfill, recount_content
+
+PRESETS = {
+    "small": dict(users=10_000, courses=20, lessons=500, questions=5_000, attempts=500_000, comments=50_000),
+    "medium": dict(users=100_000, courses=100, lessons=2_000, questions=20_000, attempts=5_000_000, comments=500_000),
+    "large": dict(users=1_000_000, courses=200, lessons=10_000, questions=100_000, attempts=50_000_000,
+                  comments=5_000_000),
+}
+ANSWERS_PER_QUESTION = 4
+WORDS = ("python loop list dict class function variable string index return import module error "
+         "value type object method array closure scope lambda generator decorator async await").split()
+
+
+class CopySource:
+    # File-like object that feeds generated rows to copy_expert in COPY text
+    # format, so no table is ever materialized in memory.
+
+    def __init__(self, rows, batch=5000):
+        self._chunks = (self._encode(chunk) for chunk in _batched(rows, batch))
+        self._buffer = b""
+        self.rows = 0
+
+    def _encode(self, chunk):
+        self.rows += len(chunk)
+        return "".join("\t".join(_field(v) for v in row) + "\n" for row in chunk).encode()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = str(value)
+    if isinstance(value, str):
+        text = text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return text
+
+
+class Zipf:
+    # Draws 0..n-1 with P(k) proportional to 1 / (k + 1) ** s
+    def __init__(self, n, s=1.1):
+        weights = [1 / (k + 1) ** s for k in range(n)]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def draw(self, rng):
+        return bisect.bisect_left(self.cumulative, rng.random() * self.total)
+
+
+def sentence(rng, n):
+    return " ".join(rng.choices(WORDS, k=n))
+
+
+# ----------------------------------------
+# Row generators
+# ----------------------------------------
+def course_rows(rng, first_id, count):
+    for i in range(count):
+        yield first_id + i, f"Course {first_id + i}", sentence(rng, 12), rng.choice(["Python", "JavaScript", "General"])
+
+
+def lesson_rows(rng, first_id, count, course_ids):
+    for i in range(count):
+        course_id = course_ids[i * len(course_ids) // count]
+        yield (first_id + i, course_id, f"Lesson {first_id + i}",
+               f"https://youtu.be/{rng.getrandbits(40):011x}", sentence(rng, 300))
+
+
+def question_rows(rng, layout):
+    for question_id, lesson_id, first_answer_id in layout:
+        yield question_id, lesson_id, sentence(rng, 10) + "?", first_answer_id + rng.randrange(ANSWERS_PER_QUESTION)
+
+
+def answer_rows(rng, layout):
+    for question_id, _, first_answer_id in layout:
+        for a in range(ANSWERS_PER_QUESTION):
+            yield first_answer_id + a, question_id, sentence(rng, 4)
+
+
+def user_rows(first_id, count):
+    for i in range(count):
+        user_id = first_id + i
+        # total_points is filled in from the attempts afterwards
+        yield user_id, f"user{user_id}", f"Generated User {user_id}", "password", "admin" if i == 0 else "student", 0
+
+
+def plan_attempts(activity, target, cap):
+    # Split target over users in proportion to activity; nobody can answer
+    # more than cap distinct questions, so capped users' excess is handed
+    # to the others.
+    counts = [0] * len(activity)
+    free = list(range(len(activity)))
+    remaining = target
+    while free and remaining > 0:
+        scale = remaining / sum(activity[i] for i in free)
+        still_free = []
+        for i in free:
+            counts[i] = round(activity[i] * scale)
+            if counts[i] >= cap:
+                counts[i] = cap
+                remaining -= cap
+            else:
+                still_free.append(i)
+        if len(still_free) == len(free):
+            break
+        free = still_free
+    return counts
+
+
+def attempt_rows(rng, user_ids, counts, questions_by_lesson, lesson_zipf):
+    # Each user answers their planned number of distinct questions, drawn
+    # mostly from hot lessons; once hot questions keep repeating, the rest
+    # are picked uniformly.
+    all_questions = [q for lesson_questions in questions_by_lesson for q in lesson_questions]
+    for user_id, wanted in zip(user_ids, counts):
+        seen = set()
+        misses = 0
+        while len(seen) < wanted:
+            if misses < 3 * wanted:
+                lesson_questions = questions_by_lesson[lesson_zipf.draw(rng)]
+                question_id = lesson_questions[rng.randrange(len(lesson_questions))]
+            else:
+                question_id = all_questions[rng.randrange(len(all_questions))]
+            if question_id in seen:
+                misses += 1
+                continue
+            seen.add(question_id)
+            attempts = 1
+            while attempts < 6 and rng.random() < 0.35:
+                attempts += 1
+            yield user_id, question_id, attempts, attempts < 6 and rng.random() < 0.9
+
+
+def comment_rows(rng, first_id, count, user_ids, lesson_ids, lesson_zipf):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i in range(count):
+        posted = now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        yield (first_id + i, lesson_ids[lesson_zipf.draw(rng)], f"user{rng.choice(user_ids)}",
+               sentence(rng, rng.randint(3, 40)), posted.isoformat())
+
+
+# ----------------------------------------
+# Loading
+# ----------------------------------------
+def next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def copy(conn, table, columns, rows):
+    started = time.monotonic()
+    source = CopySource(rows)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", source)
+    conn.commit()
+    elapsed = time.monotonic() - started
+    print(f"  {table:<15}{source.rows:>12,} rows  {elapsed:8.1f}s  {source.rows / max(elapsed, 1e-9):>12,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    for name in PRESETS["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the preset's {name} count")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if DIALECT != "postgres":
+        print("generate_dataset.py loads with COPY and needs the Postgres backend", file=sys.stderr)
+        return 2
+
+    volume = dict(PRESETS[args.preset])
+    volume.update({k: v for k, v in vars(args).items() if k in volume and v is not None})
+    volume["lessons"] = max(volume["lessons"], volume["courses"])
+    volume["questions"] = max(volume["questions"], volume["lessons"])
+    rng = random.Random(args.seed)
+    print("generating " + ", ".join(f"{v:,} {k}" for k, v in volume.items()))
+
+    create_tables()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SET synchronous_commit = off")
+        first = {t: next_id(cursor, t) for t in ("courses", "lessons", "questions", "answers", "users", "comments")}
+        conn.commit()
+
+        course_ids = list(range(first["courses"], first["courses"] + volume["courses"]))
+        lesson_ids = list(range(first["lessons"], first["lessons"] + volume["lessons"]))
+        user_ids = list(range(first["users"], first["users"] + volume["users"]))
+
+        # Questions are spread evenly over lessons; each question's answers
+        # occupy a contiguous id range so correct_answer_id is known upfront.
+        layout, questions_by_lesson = [], [[] for _ in lesson_ids]
+        for i in range(volume["questions"]):
+            lesson_index = i * len(lesson_ids) // volume["questions"]
+            question_id = first["questions"] + i
+            layout.append((question_id, lesson_ids[lesson_index], first["answers"] + i * ANSWERS_PER_QUESTION))
+            questions_by_lesson[lesson_index].append(question_id)
+
+        # Lesson popularity is shuffled so hot lessons are not all in course 1
+        order = list(range(len(lesson_ids)))
+        rng.shuffle(order)
+        lesson_zipf = Zipf(len(lesson_ids))
+        hot_questions = [questions_by_lesson[i] for i in order]
+        hot_lessons = [lesson_ids[i] for i in order]
+        activity = [rng.paretovariate(1.16) for _ in user_ids]
+
+        copy(conn, "courses", ["id", "title", "description", "language"],
+             course_rows(rng, first["courses"], volume["courses"]))
+        copy(conn, "lessons", ["id", "course_id", "title", "video_url", "lesson_text"],
+             lesson_rows(rng, first["lessons"], volume["lessons"], course_ids))
+        # Question counts are recounted once instead of by per-row triggers
+        cursor.execute("ALTER TABLE questions DISABLE TRIGGER USER")
+        try:
+            copy(conn, "questions", ["id", "lesson_id", "question_text", "correct_answer_id"],
+                 question_rows(rng, layout))
+            recount_content(cursor)
+            conn.commit()
+        finally:
+            cursor.execute("ALTER TABLE questions ENABLE TRIGGER USER")
+            conn.commit()
+        copy(conn, "answers", ["id", "question_id", "answer_text"], answer_rows(rng, layout))
+
+        # Per-row leaderboard triggers would dominate the load; the
+        # histogram is rebuilt once the points are known.
+        cursor.execute("ALTER TABLE users DISABLE TRIGGER USER")
+        try:
+            copy(conn, "users", ["id", "username", "full_name", "password", "role", "total_points"],
+                 user_rows(first["users"], volume["users"]))
+            copy(conn, "user_attempts", ["user_id", "question_id", "attempts", "is_correct"],
+                 attempt_rows(rng, user_ids, plan_attempts(activity, volume["attempts"], volume["questions"]),
+                              hot_questions, lesson_zipf))
+
+            print("  scoring users from their attempts")
+            cursor.execute("""
+                UPDATE users u SET total_points = s.points
+                FROM (
+                    SELECT user_id, SUM(CASE WHEN NOT is_correct THEN 0 """
+                + " ".join(f"WHEN attempts = {n} THEN {p}" for n, p in POINTS_BY_ATTEMPT.items()) + """
+                                         ELSE 0 END) AS points
+                    FROM user_attempts WHERE user_id BETWEEN %s AND %s
+                    GROUP BY user_id
+                ) s
+                WHERE u.id = s.user_id
+            """, (user_ids[0], user_ids[-1]))
+            cursor.execute("""
+                DELETE FROM leaderboard_scores;
+                INSERT INTO leaderboard_scores (total_points, shard, user_count)
+                SELECT total_points, id % 16, COUNT(*) FROM users GROUP BY 1, 2;
+            """)
+            conn.commit()
+        finally:
+            cursor.execute("ALTER TABLE users ENABLE TRIGGER USER")
+            conn.commit()
+
+        copy(conn, "comments", ["id", "lesson_id", "username", "text", "timestamp"],
+             comment_rows(rng, first["comments"], volume["comments"], user_ids, hot_lessons, lesson_zipf))
+
+        print("  rebuilding progress rollups")
+        backfill(user_ids[0], user_ids[-1], chunk=50_000)
+
+        print("  resetting sequences and analyzing")
+        for table in first:
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}")
+        cursor.execute("INSERT INTO content_versions (key, version) VALUES ('catalog', 1) "
+                       "ON CONFLICT (key) DO UPDATE SET version = content_versions.version + 1")
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("ANALYZE")
+        conn.autocommit = False
+        cursor.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
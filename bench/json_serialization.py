@@ -0,0 +1,94 @@
+# backend/bench/json_serialization.py
+#
+# Serialization microbenchmark: Flask's stdlib provider versus the orjson
+# provider from json_provider.py, on payloads shaped like real responses,
+# plus the size and cost of gzip/brotli on the encoded bodies. Needs no
+# database:
+#
+#     python bench/json_serialization.py
+
+import datetime
+import gzip
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import ORJSONProvider, orjson
+from compression import brotli, BROTLI_QUALITY, GZIP_LEVEL
+
+
+def words(rng, n):
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(n))
+
+
+def payloads():
+    rng = random.Random(7)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        "leaderboard (100 rows)": [
+            {"username": f"user{i}", "total_points": 5000 - i * 7, "rank": i + 1} for i in range(100)
+        ],
+        "comments (500 rows)": [
+            {"username": f"user{rng.randint(1, 9999)}", "text": words(rng, rng.randint(5, 40)),
+             "timestamp": now - datetime.timedelta(seconds=i * 37)}
+            for i in range(500)
+        ],
+        "lesson list (500 rows)": [
+            {"id": i, "title": words(rng, 4), "video_url": f"https://youtu.be/{i:011d}"} for i in range(500)
+        ],
+        "lessons with text (100 rows)": [
+            {"id": i, "course_id": 1, "title": words(rng, 4), "video_url": None, "lesson_text": words(rng, 800)}
+            for i in range(100)
+        ],
+        "quiz (20 questions)": [
+            {"id": q, "question": words(rng, 12),
+             "answers": [{"id": q * 4 + a, "text": words(rng, 5)} for a in range(4)]}
+            for q in range(20)
+        ],
+    }
+
+
+def best_of(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main():
+    if orjson is None:
+        print("orjson is not installed; nothing to compare", file=sys.stderr)
+        return 1
+
+    app = Flask(__name__)
+    providers = {"stdlib": DefaultJSONProvider(app), "orjson": ORJSONProvider(app)}
+
+    print(f"{'payload':<30}{'stdlib':>12}{'orjson':>12}{'speedup':>9}"
+          f"{'bytes':>10}{'gzip':>10}{'gzip ms':>9}{'br':>10}{'br ms':>9}")
+    with app.app_context():
+        for name, payload in payloads().items():
+            timings = {}
+            for label, provider in providers.items():
+                timings[label] = best_of(lambda: provider.response(payload), number=50)
+
+            body = providers["orjson"].response(payload).get_data()
+            gz_time = best_of(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), number=20)
+            gz_size = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+            if brotli is not None:
+                br_time = best_of(lambda: brotli.compress(body, quality=BROTLI_QUALITY), number=20)
+                br_size = len(brotli.compress(body, quality=BROTLI_QUALITY))
+            else:
+                br_time, br_size = float("nan"), 0
+
+            print(f"{name:<30}{timings['stdlib'] * 1e3:>10.3f}ms{timings['orjson'] * 1e3:>10.3f}ms"
+                  f"{timings['stdlib'] / timings['orjson']:>8.1f}x"
+                  f"{len(body):>10}{gz_size:>10}{gz_time * 1e3:>9.3f}{br_size:>10}{br_time * 1e3:>9.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
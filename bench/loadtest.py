@@ -0,0 +1,358 @@
+# backend/bench/loadtest.py
+#
+# Load test against a running app with a realistic traffic mix: quiz
+# fetches, bursts of answer submissions, leaderboard polling and comment
+# reads/posts. Reports p50/p95/p99 latency, throughput and error rate per
+# endpoint and writes the run to JSON:
+#
+#     gunicorn app:app -b 127.0.0.1:8000 &
+#     python bench/loadtest.py --url http://127.0.0.1:8000 --seed-content \
+#         --concurrency 32 --duration 60 --output bench/results/run.json
+#     python bench/loadtest.py ... --compare bench/results/baseline.json
+#
+# --seed-content imports a small course as an admin when the database has
+# no lessons; for scale runs populate it with bench/generate_dataset.py.
+# With --compare the exit status is 1 if any endpoint's p95 grew by more
+# than --max-regression or its error rate rose, so runs can gate CI.
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+DEFAULT_MIX = "quiz=35,submit=25,leaderboard=15,comment_read=20,comment_post=5"
+SUBMIT_BURST = 3  # answers sent back to back, like a student clicking through
+
+
+class Client:
+    # One keep-alive connection per virtual user; reconnects when the server
+    # closes it (sync gunicorn workers do after every response).
+
+    def __init__(self, url, token=None):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=payload, headers=self.headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, data
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def json(self, method, path, body=None):
+        status, data = self.request(method, path, body)
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> [latency seconds]
+        self.errors = {}   # endpoint -> count
+        self.recording = False
+
+    def record(self, endpoint, started, ok):
+        elapsed = time.perf_counter() - started
+        if not self.recording:
+            return
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(elapsed)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+# ----------------------------------------
+# Fixtures
+# ----------------------------------------
+def seed_content(url):
+    client = Client(url)
+    client.json("POST", "/auth/register", {"username": "loadtest_admin", "password": "loadtest", "role": "admin"})
+    status, body = client.json("POST", "/auth/login", {"username": "loadtest_admin", "password": "loadtest"})
+    if status != 200:
+        sys.exit(f"could not log in as loadtest_admin: {status} {body}")
+    admin = Client(url, token=body["token"])
+    lessons = [{
+        "title": f"Load test lesson {l}",
+        "video_url": f"https://example.com/{l}",
+        "lesson_text": "Lorem ipsum " * 50,
+        "questions": [{
+            "question_text": f"Question {l}.{q}?",
+            "answers": [{"text": f"Answer {a}", "is_correct": a == 0} for a in range(4)],
+        } for q in range(5)],
+    } for l in range(5)]
+    status, body = admin.json("POST", "/courses/import", {"title": "Load test course", "lessons": lessons})
+    if status != 201:
+        sys.exit(f"could not import the load test course: {status} {body}")
+
+
+def discover(url, max_lessons):
+    client = Client(url)
+    _, courses = client.json("GET", "/courses")
+    lessons = []
+    for course in courses or []:
+        _, rows = client.json("GET", f"/courses/{course['id']}/lessons?fields=id")
+        lessons.extend(row["id"] for row in rows or [])
+        if len(lessons) >= max_lessons:
+            break
+    quizzes = {}
+    for lesson_id in lessons[:max_lessons]:
+        _, quiz = client.json("GET", f"/quiz/{lesson_id}")
+        questions = [(q["id"], [a["id"] for a in q["answers"]]) for q in quiz or [] if q["answers"]]
+        if questions:
+            quizzes[lesson_id] = questions
+    return quizzes
+
+
+def ensure_users(url, count):
+    client = Client(url)
+    names = [f"loadtest_user_{i}" for i in range(count)]
+    for name in names:
+        client.request("POST", "/auth/register", {"username": name, "password": "loadtest"})
+    return names
+
+
+# ----------------------------------------
+# Scenarios
+# ----------------------------------------
+def hot_lesson(rng, lessons):
+    # A few lessons get most of the traffic
+    return lessons[min(int(rng.paretovariate(1.2)) - 1, len(lessons) - 1)]
+
+
+def quiz(client, rng, fx, rec):
+    started = time.perf_counter()
+    status, _ = client.request("GET", f"/quiz/{hot_lesson(rng, fx['lessons'])}")
+    rec.record("GET /quiz/<lesson_id>", started, status == 200)
+
+
+def submit(client, rng, fx, rec):
+    username = rng.choice(fx["users"])
+    questions = fx["quizzes"][hot_lesson(rng, fx["lessons"])]
+    for _ in range(SUBMIT_BURST):
+        question_id, answers = rng.choice(questions)
+        started = time.perf_counter()
+        status, _ = client.request("POST", "/submit-answer", {
+            "username": username, "question_id": question_id, "answer_id": rng.choice(answers)})
+        rec.record("POST /submit-answer", started, status == 200)
+
+
+def submit_quiz(client, rng, fx, rec):
+    # The whole quiz in one request; compare with submit via --mix
+    lesson_id = hot_lesson(rng, fx["lessons"])
+    started = time.perf_counter()
+    status, _ = client.request("POST", "/submit-quiz", {
+        "username": rng.choice(fx["users"]), "lesson_id": lesson_id,
+        "answers": [{"question_id": question_id, "answer_id": rng.choice(answers)}
+                    for question_id, answers in fx["quizzes"][lesson_id]]})
+    rec.record("POST /submit-quiz", started, status == 200)
+
+
+def leaderboard(client, rng, fx, rec):
+    started = time.perf_counter()
+    status, _ = client.request("GET", "/auth/leaderboard")
+    rec.record("GET /auth/leaderboard", started, status == 200)
+
+
+def comment_read(client, rng, fx, rec):
+    started = time.perf_counter()
+    status, _ = client.request("GET", f"/comments/{hot_lesson(rng, fx['lessons'])}?limit=50")
+    rec.record("GET /comments/<lesson_id>", started, status == 200)
+
+
+def comment_post(client, rng, fx, rec):
+    started = time.perf_counter()
+    status, _ = client.request("POST", "/comments", {
+        "lesson_id": hot_lesson(rng, fx["lessons"]),
+        "username": rng.choice(fx["users"]),
+        "text": f"load test comment {rng.random():.6f}",
+    })
+    rec.record("POST /comments", started, status == 201)
+
+
+SCENARIOS = {
+    "quiz": quiz,
+    "submit": submit,
+    "submit_quiz": submit_quiz,
+    "leaderboard": leaderboard,
+    "comment_read": comment_read,
+    "comment_post": comment_post,
+}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ----------------------------------------
+# Run and report
+# ----------------------------------------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(rec, duration):
+    endpoints = {}
+    for endpoint, samples in sorted(rec.samples.items()):
+        samples.sort()
+        errors = rec.errors.get(endpoint, 0)
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples),
+            "throughput_rps": len(samples) / duration,
+            "p50_ms": percentile(samples, 50) * 1e3,
+            "p95_ms": percentile(samples, 95) * 1e3,
+            "p99_ms": percentile(samples, 99) * 1e3,
+            "max_ms": samples[-1] * 1e3,
+        }
+    return endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(endpoints):
+    print(f"{'endpoint':<30}{'reqs':>8}{'req/s':>9}{'err %':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, s in endpoints.items():
+        print(f"{endpoint:<30}{s['requests']:>8}{s['throughput_rps']:>9.1f}{s['error_rate'] * 100:>7.2f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+
+
+def compare(endpoints, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["endpoints"]
+    regressions = 0
+    print(f"\ncompared with {baseline_path}:")
+    for endpoint, s in endpoints.items():
+        before = baseline.get(endpoint)
+        if before is None:
+            continue
+        change = s["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0
+        worse = change > max_regression or s["error_rate"] > before["error_rate"] + 0.001
+        regressions += worse
+        print(f"  {'REGRESSED' if worse else 'ok':>9}  {endpoint:<30} p95 {before['p95_ms']:.1f} -> "
+              f"{s['p95_ms']:.1f} ms ({change:+.0%}), errors {before['error_rate']:.2%} -> {s['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds first")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=200, help="load test accounts to register")
+    parser.add_argument("--lessons", type=int, default=50, help="lessons to spread traffic over")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a virtual user's actions")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-content", action="store_true", help="import a small course if there are no lessons")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="previous results JSON to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative p95 increase")
+    args = parser.parse_args()
+
+    quizzes = discover(args.url, args.lessons)
+    if not quizzes and args.seed_content:
+        seed_content(args.url)
+        quizzes = discover(args.url, args.lessons)
+    if not quizzes:
+        sys.exit("no lessons with quiz questions found; run with --seed-content or bench/generate_dataset.py")
+
+    fixtures = {"quizzes": quizzes, "lessons": list(quizzes), "users": ensure_users(args.url, args.users)}
+    names, weights = zip(*args.mix.items())
+    rec = Recorder()
+    stop = threading.Event()
+
+    def virtual_user(n):
+        rng = random.Random(args.seed * 100003 + n)
+        client = Client(args.url)
+        while not stop.is_set():
+            scenario = SCENARIOS[rng.choices(names, weights)[0]]
+            try:
+                scenario(client, rng, fixtures, rec)
+            except OSError:
+                rec.record(scenario.__name__, time.perf_counter(), False)
+                client.close()
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000)
+        client.close()
+
+    threads = [threading.Thread(target=virtual_user, args=(n,), daemon=True) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    rec.recording = True
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    time.sleep(args.duration)
+    rec.recording = False
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+
+    endpoints = summarize(rec, args.duration)
+    print_table(endpoints)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "started_at": started_at.isoformat(),
+                "commit": git_commit(),
+                "config": {
+                    "url": args.url, "concurrency": args.concurrency, "duration": args.duration,
+                    "warmup": args.warmup, "mix": args.mix, "users": args.users,
+                    "lessons": len(fixtures["lessons"]), "think_ms": args.think_ms, "seed": args.seed,
+                },
+                "endpoints": endpoints,
+            }, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.compare and compare(endpoints, args.compare, args.max_regression):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# backend/bench/score_histogram.py
+#
+# Concurrent points awards against the leaderboard_scores histogram. Every
+# award moves a user between two histogram rows inside the grading
+# transaction, so awards to users on the same score queue on those rows
+# until each other commits. Run against a scratch database:
+#
+#     DB_HOST=localhost DB_NAME=fcc_bench python migrations.py
+#     DB_HOST=localhost DB_NAME=fcc_bench python bench/score_histogram.py --threads 16 --rtt-ms 2
+#
+# Each thread awards points to its own fresh users, all starting at 0 and
+# moving through the same scores, which is what a wave of new users taking
+# their first quizzes looks like. --rtt-ms holds each transaction open that
+# much longer before COMMIT, modelling the round trips to a hosted database
+# that the real grading transaction spends while holding its row locks.
+# Run it at schema version 9 and 10 to compare one histogram row per score
+# with the sharded rows. The bench users are deleted afterwards.
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+
+
+def connect():
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+
+
+def run(threads, users_per_thread, awards, rtt):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO users (username, total_points)
+        SELECT 'bench_histogram_' || n, 0 FROM generate_series(1, %s) AS n
+        RETURNING id
+    """, (threads * users_per_thread,))
+    ids = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+
+    start = threading.Barrier(threads + 1)
+    lock = threading.Lock()
+    waits = []
+
+    def awarder(mine):
+        worker = connect()
+        worker_cursor = worker.cursor()
+        start.wait()
+        for _ in range(awards):
+            for user_id in mine:
+                began = time.perf_counter()
+                worker_cursor.execute("UPDATE users SET total_points = total_points + 10 WHERE id = %s", (user_id,))
+                elapsed = time.perf_counter() - began
+                time.sleep(rtt)
+                worker.commit()
+                with lock:
+                    waits.append(elapsed)
+        worker.close()
+
+    workers = [threading.Thread(target=awarder, args=(ids[i::threads],)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+
+    cursor.execute("""
+        SELECT COALESCE(SUM(user_count), 0) FROM leaderboard_scores
+        WHERE total_points = %s
+    """, (awards * 10,))
+    at_final_score = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM users WHERE id = ANY(%s)", (ids,))
+    conn.commit()
+    conn.close()
+    return elapsed, waits, at_final_score, len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16, help="concurrent grading transactions")
+    parser.add_argument("--users-per-thread", type=int, default=5)
+    parser.add_argument("--awards", type=int, default=20, help="awards per user")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="extra time each transaction holds its locks")
+    args = parser.parse_args()
+
+    with connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        version = cursor.fetchone()[0]
+
+    elapsed, waits, at_final_score, users = run(args.threads, args.users_per_thread, args.awards,
+                                                args.rtt_ms / 1000)
+    waits.sort()
+    total = len(waits)
+    print(f"schema v{version}: {total / elapsed:8.0f} awards/s  "
+          f"update p50={waits[total // 2] * 1000:6.2f}ms  p95={waits[int(total * 0.95) - 1] * 1000:6.2f}ms  "
+          f"histogram ok={at_final_score >= users}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# backend/bench/submit_answer.py
+#
+# Concurrent /submit-answer grading: the old six-round-trip sequence versus
+# the single grade_answer() call. Run against a scratch database:
+#
+#     DB_HOST=localhost DB_NAME=fcc_bench python migrations.py
+#     DB_HOST=localhost DB_NAME=fcc_bench python bench/submit_answer.py --threads 16
+#
+# Every thread hammers the same user, mimicking double-clicks and retries,
+# so row-lock contention is part of what gets measured. After each run the
+# script checks how many times points were awarded per question.
+#
+# --rtt-ms adds a sleep to every statement and commit to model the network
+# distance to a hosted database, which is where round trips really cost.
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2 import extensions
+
+from db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+
+RTT = 0.0
+
+
+class LatencyCursor(extensions.cursor):
+    def execute(self, query, vars=None):
+        time.sleep(RTT)
+        return super().execute(query, vars)
+
+
+class LatencyConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", LatencyCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        time.sleep(RTT)
+        return super().commit()
+
+
+def connect():
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT,
+                            connection_factory=LatencyConnection)
+
+
+def legacy_submit(conn, username, question_id, answer_id):
+    # Copy of the pre-migration route body, kept here for comparison only
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+    user_id = cursor.fetchone()[0]
+    cursor.execute("SELECT correct_answer_id FROM questions WHERE id = %s", (question_id,))
+    correct_answer_id = cursor.fetchone()[0]
+    cursor.execute("SELECT attempts, is_correct FROM user_attempts WHERE user_id = %s AND question_id = %s", (user_id, question_id))
+    attempt = cursor.fetchone()
+    if attempt and attempt[1]:
+        conn.commit()
+        return
+    if attempt:
+        attempts = attempt[0] + 1
+        cursor.execute("UPDATE user_attempts SET attempts = %s WHERE user_id = %s AND question_id = %s", (attempts, user_id, question_id))
+    else:
+        attempts = 1
+        cursor.execute("INSERT INTO user_attempts (user_id, question_id, attempts) VALUES (%s, %s, %s)", (user_id, question_id, attempts))
+    if answer_id == correct_answer_id:
+        cursor.execute("UPDATE user_attempts SET is_correct = TRUE WHERE user_id = %s AND question_id = %s", (user_id, question_id))
+        points = 10 if attempts == 1 else 7 if attempts == 2 else 5 if attempts == 3 else 0
+        cursor.execute("UPDATE users SET total_points = total_points + %s WHERE id = %s", (points, user_id))
+    conn.commit()
+
+
+def atomic_submit(conn, username, question_id, answer_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM grade_answer(%s, %s, %s)", (username, question_id, answer_id))
+    cursor.fetchone()
+    conn.commit()
+
+
+def setup(conn, questions):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO courses (title) VALUES ('bench') RETURNING id")
+    course_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO lessons (course_id, title) VALUES (%s, 'bench') RETURNING id", (course_id,))
+    lesson_id = cursor.fetchone()[0]
+    question_ids = []
+    for _ in range(questions):
+        cursor.execute("INSERT INTO questions (lesson_id, question_text) VALUES (%s, 'q') RETURNING id", (lesson_id,))
+        question_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO answers (question_id, answer_text) VALUES (%s, 'a') RETURNING id", (question_id,))
+        answer_id = cursor.fetchone()[0]
+        cursor.execute("UPDATE questions SET correct_answer_id = %s WHERE id = %s", (answer_id, question_id))
+        question_ids.append((question_id, answer_id))
+    conn.commit()
+    return course_id, lesson_id, question_ids
+
+
+def reset_user(conn, username):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_attempts WHERE user_id IN (SELECT id FROM users WHERE username = %s)", (username,))
+    cursor.execute("DELETE FROM users WHERE username = %s", (username,))
+    cursor.execute("INSERT INTO users (username, total_points) VALUES (%s, 0)", (username,))
+    conn.commit()
+
+
+def teardown(conn, course_id, lesson_id, username):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_attempts WHERE question_id IN (SELECT id FROM questions WHERE lesson_id = %s)", (lesson_id,))
+    cursor.execute("DELETE FROM answers WHERE question_id IN (SELECT id FROM questions WHERE lesson_id = %s)", (lesson_id,))
+    cursor.execute("DELETE FROM questions WHERE lesson_id = %s", (lesson_id,))
+    cursor.execute("DELETE FROM lessons WHERE id = %s", (lesson_id,))
+    cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+    cursor.execute("DELETE FROM users WHERE username = %s", (username,))
+    conn.commit()
+
+
+def run(submit, question_ids, username, threads, rounds):
+    errors = []
+
+    def worker(offset):
+        conn = connect()
+        try:
+            for i in range(rounds):
+                question_id, answer_id = question_ids[(offset + i) % len(question_ids)]
+                # Every fourth submission is wrong so the attempt counter moves too
+                chosen = answer_id if i % 4 else -1
+                try:
+                    submit(conn, username, question_id, chosen)
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    errors.append(type(e).__name__)
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=200, help="submissions per thread")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated network round trip")
+    args = parser.parse_args()
+
+    global RTT
+
+    username = "bench_submit_user"
+    conn = connect()
+    course_id, lesson_id, question_ids = setup(conn, args.questions)
+    RTT = args.rtt_ms / 1000.0
+    try:
+        for label, submit in (("legacy", legacy_submit), ("grade_answer", atomic_submit)):
+            reset_user(conn, username)
+            elapsed, errors = run(submit, question_ids, username, args.threads, args.rounds)
+            total = args.threads * args.rounds
+
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*), COUNT(*) - COUNT(DISTINCT question_id)
+                FROM user_attempts ua JOIN users u ON u.id = ua.user_id
+                WHERE u.username = %s
+            """, (username,))
+            rows, duplicates = cursor.fetchone()
+            cursor.execute("SELECT total_points FROM users WHERE username = %s", (username,))
+            points = cursor.fetchone()[0]
+            conn.commit()
+
+            print(f"{label:>13}: {total / elapsed:8.0f} submissions/s  "
+                  f"errors={len(errors)}  attempt rows={rows}  duplicate rows={duplicates}  "
+                  f"points={points} (max {10 * len(question_ids)})")
+    finally:
+        teardown(conn, course_id, lesson_id, username)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# backend/comment_writer.py
+#
+# Optional group-commit path for POST /comments, enabled with
+# COMMENT_WRITES=batched. Instead of one INSERT + COMMIT per request, the
+# request queues its comment here and waits; a flusher thread per worker
+# collects whatever arrived within COMMENT_BATCH_WAIT_MS (or
+# COMMENT_BATCH_SIZE rows, whichever comes first), writes it with one
+# multi-row INSERT in one transaction, and then acknowledges every caller
+# in the batch. Callers still only get 201 once their row is committed.
+#
+# Batches only form when a worker has several requests in flight, i.e.
+# with SERVER_MODE=async (gevent) or a threaded server. Pending comments
+# are flushed by drain(), called from gunicorn's worker_exit hook and at
+# interpreter exit.
+
+import atexit
+import os
+import threading
+import time
+
+import metrics
+from db import DatabaseError, connection, insert_rows
+from live import publish_comments
+
+BATCHED = os.getenv("COMMENT_WRITES", "direct") == "batched"
+BATCH_SIZE = int(os.getenv("COMMENT_BATCH_SIZE", "200"))
+BATCH_WAIT_MS = float(os.getenv("COMMENT_BATCH_WAIT_MS", "5"))
+ACK_TIMEOUT = float(os.getenv("COMMENT_ACK_TIMEOUT", "10"))  # seconds a request waits for its batch
+
+INSERT_SQL = "INSERT INTO comments (lesson_id, username, text) VALUES %s RETURNING id, timestamp"
+
+BATCH_SIZES = metrics.register(metrics.Histogram(
+    "comment_write_batch_size", "Comments committed per group-commit batch.",
+    buckets=metrics.QUERY_COUNT_BUCKETS,
+))
+
+
+class WriterClosed(Exception):
+    pass
+
+
+class StillPending(Exception):
+    # Timed out after the comment's batch started writing: it will most
+    # likely commit, so the caller must not invite a retry
+    pass
+
+
+class _Pending:
+    __slots__ = ("row", "done", "result", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CommentWriter:
+    def __init__(self, batch_size=BATCH_SIZE, batch_wait_ms=BATCH_WAIT_MS):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._cond = threading.Condition()
+        self._pending = []
+        self._flusher = None
+        self._pid = None
+        self._closed = False
+
+    def submit(self, lesson_id, username, text, timeout=ACK_TIMEOUT):
+        # Blocks until the comment is committed; returns (id, timestamp).
+        # On timeout a comment still queued is withdrawn (TimeoutError, safe
+        # to retry); one already being written raises StillPending.
+        item = _Pending((lesson_id, username, text))
+        with self._cond:
+            if self._closed:
+                raise WriterClosed("comment writer is draining")
+            self._ensure_flusher()
+            self._pending.append(item)
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        if not item.done.wait(timeout):
+            with self._cond:
+                if item in self._pending:
+                    self._pending.remove(item)
+                    raise TimeoutError("comment was not committed in time")
+            if not item.done.is_set():
+                raise StillPending("comment is being committed")
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def drain(self):
+        # Stop accepting comments and wait for everything queued to commit
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            flusher = self._flusher if self._pid == os.getpid() else None
+        if flusher is not None:
+            flusher.join()
+
+    def _ensure_flusher(self):
+        # Called with the lock held; restarts the thread in forked workers
+        if self._flusher is not None and self._flusher.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run, name="comment-writer", daemon=True)
+        self._flusher.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Linger briefly so concurrent requests join this batch
+                deadline = time.monotonic() + self.batch_wait
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self._commit(batch)
+        except DatabaseError as error:
+            if len(batch) == 1:
+                _fail(batch, error)
+                return
+            # One bad row (e.g. an unknown lesson) must not fail the others
+            for item in batch:
+                try:
+                    self._commit([item])
+                except Exception as item_error:
+                    _fail([item], item_error)
+        except Exception as error:
+            _fail(batch, error)
+
+    def _commit(self, batch):
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                results = insert_rows(cursor, INSERT_SQL, [item.row for item in batch],
+                                      page_size=len(batch), fetch=True)
+                publish_comments(cursor, [(comment_id, *item.row, posted)
+                                          for item, (comment_id, posted) in zip(batch, results)])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        BATCH_SIZES.observe(len(batch))
+        for item, result in zip(batch, results):
+            item.result = tuple(result)
+            item.done.set()
+
+
+def _fail(batch, error):
+    for item in batch:
+        item.error = error
+        item.done.set()
+
+
+writer = CommentWriter()
+atexit.register(writer.drain)
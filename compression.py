@@ -0,0 +1,74 @@
+# backend/compression.py
+#
+# Negotiated response compression. Buffered responses whose body is at
+# least COMPRESS_MIN_SIZE bytes are encoded with brotli (when installed)
+# or gzip, following the client's Accept-Encoding preferences. Streamed
+# responses (exports) are passed through untouched.
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/html",
+    "text/plain",
+}
+
+# Strong ETags get the coding appended, since each coding is a distinct
+# representation; http_cache accepts these suffixes on If-None-Match.
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    options = [("br", accepted["br"])] if brotli is not None else []
+    options.append(("gzip", accepted["gzip"]))
+    encoding, quality = max(options, key=lambda option: option[1])
+    return encoding if quality > 0 else None
+
+
+def compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        body = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + ETAG_SUFFIXES[encoding])
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,370 @@
+# backend/db.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from flask import g
+
+import metrics
+
+# Connection settings come from the environment (see .env); the Render
+# database is the fallback so existing deployments keep working.
+DB_NAME = os.getenv("DB_NAME", "fcc_clone")
+DB_USER = os.getenv("DB_USER", "fcc_clone_user")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "essfA7Cp2fMoEGtxj4VtZkROg3bSnlW3")
+DB_HOST = os.getenv("DB_HOST", "dpg-d0umgre3jp1c738irgug-a.oregon-postgres.render.com")
+DB_PORT = os.getenv("DB_PORT", "5432")
+
+# DB_BACKEND=sqlite runs the whole app on an embedded SQLite file instead
+# (see sqlite_db.py); DIALECT is what dialect-specific SQL branches on.
+DIALECT = os.getenv("DB_BACKEND", "postgres")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db"))
+
+if DIALECT == "sqlite":
+    import sqlite3
+    import sqlite_db
+
+    DatabaseError = (psycopg2.Error, sqlite3.Error)
+    UniqueViolation = sqlite3.IntegrityError
+    UndefinedTable = sqlite3.OperationalError
+else:
+    DatabaseError = psycopg2.Error
+    UniqueViolation = psycopg2.errors.UniqueViolation
+    UndefinedTable = psycopg2.errors.UndefinedTable
+
+# Pool tuning
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))          # seconds to wait for a free connection
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))       # close idle connections above min size
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))  # recycle connections older than this
+POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))  # ping connections idle longer than this
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class InstrumentedCursor(extensions.cursor):
+    # Feeds per-statement timings and row counts to metrics.py
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.observe_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.observe_query(query, time.perf_counter() - started, self.rowcount)
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 max_idle=POOL_MAX_IDLE, max_lifetime=POOL_MAX_LIFETIME,
+                 check_after=POOL_CHECK_AFTER, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []      # most recently returned last
+        self._in_use = {}    # id(conn) -> _PooledConnection
+        self._opening = 0
+        self._pid = os.getpid()
+        self._closed = False
+
+    # ---------- connection lifecycle ----------
+
+    def _connect(self):
+        if DIALECT == "sqlite":
+            return _PooledConnection(sqlite_db.connect(SQLITE_PATH))
+        return _PooledConnection(psycopg2.connect(cursor_factory=InstrumentedCursor, **self.connect_kwargs))
+
+    def _is_expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _is_healthy(self, entry, now):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if now - entry.last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except DatabaseError:
+            return False
+
+    @staticmethod
+    def _discard(entry):
+        try:
+            entry.conn.close()
+        except DatabaseError:
+            pass
+
+    def _check_fork(self):
+        # Connections inherited from the parent process share its sockets.
+        # Closing them here would terminate the parent's sessions, so they
+        # are simply forgotten and the child starts with an empty pool.
+        if self._pid != os.getpid():
+            _orphaned.extend(entry.conn for entry in self._idle)
+            _orphaned.extend(entry.conn for entry in self._in_use.values())
+            self._idle = []
+            self._in_use = {}
+            self._opening = 0
+            self._pid = os.getpid()
+            self._cond = threading.Condition()
+
+    # ---------- checkout / return ----------
+
+    def getconn(self):
+        started = time.perf_counter()
+        try:
+            conn = self._getconn()
+        except PoolTimeout:
+            metrics.observe_pool_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.observe_pool_wait(time.perf_counter() - started)
+        return conn
+
+    def _getconn(self):
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use[id(entry.conn)] = entry
+                    break
+
+                if len(self._in_use) + self._opening < self.max_size:
+                    self._opening += 1
+                    entry = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No database connection available within {self.timeout:g}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        if entry is None:
+            try:
+                entry = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+            return entry.conn
+
+        now = time.monotonic()
+        if self._is_expired(entry, now) or not self._is_healthy(entry, now):
+            self._discard(entry)
+            try:
+                fresh = self._connect()
+            except Exception:
+                with self._cond:
+                    del self._in_use[id(entry.conn)]
+                    self._cond.notify()
+                raise
+            with self._cond:
+                del self._in_use[id(entry.conn)]
+                self._in_use[id(fresh.conn)] = fresh
+            entry = fresh
+        return entry.conn
+
+    def putconn(self, conn, discard=False):
+        self._check_fork()
+        entry = self._in_use.get(id(conn))
+        if entry is None:
+            return
+
+        now = time.monotonic()
+        if not discard and not conn.closed:
+            # Never hand out a connection with an open transaction
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except DatabaseError:
+                    discard = True
+
+        discard = discard or conn.closed or self._closed or self._is_expired(entry, now)
+        with self._cond:
+            del self._in_use[id(conn)]
+            if not discard:
+                entry.last_used = now
+                self._idle.append(entry)
+                self._prune_idle(now)
+            self._cond.notify()
+        if discard:
+            self._discard(entry)
+
+    def _prune_idle(self, now):
+        # Oldest idle connections sit at the front; keep at least min_size open.
+        while self._idle and len(self._idle) + len(self._in_use) > self.min_size:
+            if now - self._idle[0].last_used <= self.max_idle:
+                break
+            self._discard(self._idle.pop(0))
+
+    def fill(self):
+        # Open connections up to min_size so the first requests skip the handshake
+        self._check_fork()
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) + len(self._in_use) + self._opening >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                entry = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+            with self._cond:
+                self._idle.insert(0, entry)
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"in_use": len(self._in_use), "idle": len(self._idle), "max": self.max_size}
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+
+_orphaned = []
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                )
+    return _pool
+
+
+metrics.register(metrics.Gauge(
+    "db_pool_connections", "Pooled connections by state.", ("state",),
+    lambda: {(state,): count for state, count in get_pool().stats().items()},
+))
+
+
+def after_fork():
+    # Called from gunicorn's post_fork hook: give each worker its own pool.
+    global _pool, _pool_lock
+    if _pool is not None:
+        _pool._check_fork()
+    _pool_lock = threading.Lock()
+    try:
+        get_pool().fill()
+    except DatabaseError:
+        pass  # the first request will retry
+
+
+def use_green_connections():
+    # Async serving mode (gunicorn's gevent worker, see gunicorn.conf.py):
+    # psycopg2 hands every wait on the server to this callback, which parks
+    # the current greenlet instead of blocking the whole worker, so one
+    # process keeps many requests in flight across database round trips.
+    from gevent.socket import wait_read, wait_write
+
+    def wait(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(wait)
+
+
+def insert_rows(cursor, sql, rows, page_size=1000, fetch=False):
+    # Multi-row INSERT: sql ends in "VALUES %s". With fetch=True the sql has a
+    # RETURNING clause and its rows come back in input order.
+    if DIALECT == "sqlite":
+        return sqlite_db.insert_rows(cursor, sql, rows, fetch)
+    return execute_values(cursor, sql, rows, page_size=page_size, fetch=fetch)
+
+
+# ----------------------------------------
+# Request-scoped and standalone access
+# ----------------------------------------
+def get_db():
+    # One pooled connection per request, returned by close_db on teardown
+    if "db_conn" not in g:
+        g.db_conn = get_pool().getconn()
+    return g.db_conn
+
+
+def close_db(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+
+@contextmanager
+def connection():
+    # For code running outside a request (startup, CLI, background work)
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+    @app.errorhandler(PoolTimeout)
+    def pool_timeout(error):
+        return {"error": "Server is busy, please try again."}, 503
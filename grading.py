@@ -0,0 +1,191 @@
+# backend/grading.py
+#
+# Answer grading used by the quiz routes. On Postgres this is one call to
+# the grade_answer() database function (see migrations.py). SQLite has no
+# stored procedures, so the same steps run here; each is a local call and
+# the attempt upsert takes SQLite's single write lock, which keeps a
+# concurrent double-submit from being graded twice.
+
+from db import DIALECT
+from leaderboards import ALL_COURSES, WINDOWS, bucket_start
+
+# Points for a correct answer on the 1st, 2nd and 3rd attempt; later ones score 0
+POINTS_BY_ATTEMPT = {1: 10, 2: 7, 3: 5}
+
+# A lesson or course badge is awarded once every question is answered
+# correctly, by average points per question (gold: all first try). Mirrors
+# the progress_badge() database function.
+BADGES = (("gold", 10), ("silver", 7), ("bronze", 0))
+
+
+# The attempt upsert; grade_attempt() in migrations.py runs the same statement
+ATTEMPT_UPSERT = """
+    INSERT INTO user_attempts AS ua (user_id, question_id, attempts, is_correct)
+    VALUES (%s, %s, 1, %s)
+    ON CONFLICT (user_id, question_id) DO UPDATE
+        SET attempts = COALESCE(ua.attempts, 0) + 1,
+            is_correct = excluded.is_correct
+        WHERE NOT COALESCE(ua.is_correct, FALSE)
+    RETURNING attempts
+"""
+
+
+def badge(points, correct, questions):
+    if not questions or correct < questions:
+        return None
+    for name, per_question in BADGES:
+        if points >= per_question * questions:
+            return name
+
+
+def grade_answer(cursor, username, question_id, answer_id):
+    # Returns (outcome, attempts, points_awarded), outcome being one of
+    # no_user, no_question, already_correct, incorrect or correct.
+    if DIALECT != "sqlite":
+        cursor.execute("SELECT * FROM grade_answer(%s, %s, %s)", (username, question_id, answer_id))
+        return cursor.fetchone()
+
+    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+    user = cursor.fetchone()
+    if user is None:
+        return "no_user", None, None
+
+    cursor.execute("""
+        SELECT q.correct_answer_id, q.lesson_id, l.course_id
+        FROM questions q LEFT JOIN lessons l ON l.id = q.lesson_id
+        WHERE q.id = %s
+    """, (question_id,))
+    question = cursor.fetchone()
+    if question is None:
+        return "no_question", None, None
+
+    outcome, attempts, points = _grade_attempt(cursor, user[0], question_id, *question, answer_id)
+    if points:
+        cursor.execute("UPDATE users SET total_points = COALESCE(total_points, 0) + %s WHERE id = %s",
+                       (points, user[0]))
+    return outcome, attempts, points
+
+
+def grade_quiz(cursor, username, lesson_id, answers):
+    # Grades [(question_id, answer_id)] for one lesson in one transaction,
+    # with the same rules as grade_answer. Returns None for an unknown user,
+    # else [(question_id, outcome, attempts, points_awarded)] in request
+    # order; questions outside the lesson come back as no_question.
+    if DIALECT != "sqlite":
+        cursor.execute("SELECT * FROM grade_quiz(%s, %s, %s::integer[], %s::integer[])",
+                       (username, lesson_id, [q for q, _ in answers], [a for _, a in answers]))
+        rows = cursor.fetchall()
+        if rows and rows[0][2] == "no_user":
+            return None
+        return [row[1:] for row in sorted(rows)]
+
+    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+    user = cursor.fetchone()
+    if user is None:
+        return None
+
+    cursor.execute("""
+        SELECT q.id, q.correct_answer_id, l.course_id
+        FROM questions q JOIN lessons l ON l.id = q.lesson_id
+        WHERE q.lesson_id = %s
+    """, (lesson_id,))
+    questions = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    results, total = [], 0
+    for question_id, answer_id in answers:
+        if question_id not in questions:
+            results.append((question_id, "no_question", None, None))
+            continue
+        correct_answer_id, course_id = questions[question_id]
+        outcome, attempts, points = _grade_attempt(cursor, user[0], question_id, correct_answer_id,
+                                                   lesson_id, course_id, answer_id)
+        total += points or 0
+        results.append((question_id, outcome, attempts, points))
+    if total:
+        cursor.execute("UPDATE users SET total_points = COALESCE(total_points, 0) + %s WHERE id = %s",
+                       (total, user[0]))
+    return results
+
+
+def _grade_attempt(cursor, user_id, question_id, correct_answer_id, lesson_id, course_id, answer_id):
+    # SQLite counterpart of the grade_attempt() database function; the caller
+    # adds the points to users.total_points
+    is_correct = answer_id == correct_answer_id
+    cursor.execute(ATTEMPT_UPSERT, (user_id, question_id, is_correct))
+    row = cursor.fetchone()
+    if row is None:
+        return "already_correct", None, None
+    attempts = row[0]
+
+    if not is_correct:
+        return "incorrect", attempts, 0
+
+    points = POINTS_BY_ATTEMPT.get(attempts, 0)
+    if lesson_id is not None:
+        record_progress(cursor, user_id, lesson_id, points)
+    if points:
+        record_points(cursor, user_id, question_id, course_id, points)
+    return "correct", attempts, points
+
+
+def record_progress(cursor, user_id, lesson_id, points):
+    # SQLite counterpart of the record_progress() database function: updates
+    # the rollups described in progress.py
+    cursor.execute("""
+        SELECT l.course_id, l.question_count, c.question_count
+        FROM lessons l LEFT JOIN courses c ON c.id = l.course_id
+        WHERE l.id = %s
+    """, (lesson_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    course_id, questions, course_questions = row
+
+    cursor.execute("""
+        INSERT INTO user_progress AS up (user_id, lesson_id, questions_correct, is_completed)
+        VALUES (%s, %s, 1, %s)
+        ON CONFLICT (user_id, lesson_id) DO UPDATE
+            SET questions_correct = up.questions_correct + 1,
+                is_completed = up.questions_correct + 1 >= %s
+        RETURNING questions_correct
+    """, (user_id, lesson_id, 1 >= questions, questions))
+    correct = cursor.fetchone()[0]
+
+    cursor.execute("""
+        INSERT INTO user_points AS pt (user_id, lesson_id, points, badge)
+        VALUES (%s, %s, %s, NULL)
+        ON CONFLICT (user_id, lesson_id) DO UPDATE SET points = pt.points + excluded.points
+        RETURNING points
+    """, (user_id, lesson_id, points))
+    lesson_points = cursor.fetchone()[0]
+    cursor.execute("UPDATE user_points SET badge = %s WHERE user_id = %s AND lesson_id = %s",
+                   (badge(lesson_points, correct, questions), user_id, lesson_id))
+
+    if course_id is None:
+        return
+    cursor.execute("""
+        INSERT INTO course_progress AS cp (user_id, course_id, lessons_completed, questions_correct, points)
+        VALUES (%s, %s, %s, 1, %s)
+        ON CONFLICT (user_id, course_id) DO UPDATE
+            SET lessons_completed = cp.lessons_completed + excluded.lessons_completed,
+                questions_correct = cp.questions_correct + 1,
+                points = cp.points + excluded.points
+        RETURNING questions_correct, points
+    """, (user_id, course_id, int(correct == questions), points))
+    course_correct, course_points = cursor.fetchone()
+    cursor.execute("UPDATE course_progress SET badge = %s WHERE user_id = %s AND course_id = %s",
+                   (badge(course_points, course_correct, course_questions), user_id, course_id))
+
+
+def record_points(cursor, user_id, question_id, course_id, points):
+    # SQLite counterpart of the record_points() database function: appends
+    # to the ledger and adds to this week's and month's leaderboard buckets
+    cursor.execute("INSERT INTO points_ledger (user_id, question_id, course_id, points) VALUES (%s, %s, %s, %s)",
+                   (user_id, question_id, course_id, points))
+    courses = (ALL_COURSES,) if course_id is None else (ALL_COURSES, course_id)
+    cursor.executemany("""
+        INSERT INTO leaderboard_windows AS w (period, bucket_start, course_id, user_id, points)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (period, bucket_start, course_id, user_id) DO UPDATE SET points = w.points + excluded.points
+    """, [(window, bucket_start(window).isoformat(), course, user_id, points)
+          for window in WINDOWS for course in courses])
@@ -0,0 +1,41 @@
+# backend/gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` (see Procfile).
+#
+# SERVER_MODE=sync (default) runs the classic one-request-per-worker model.
+# SERVER_MODE=async runs gevent workers: the same Flask app and routes, but
+# each worker multiplexes WORKER_CONNECTIONS requests over green psycopg2
+# connections, so time spent waiting on a remote database no longer idles
+# the process. Raise DB_POOL_MAX with it, since the pool then bounds how
+# many requests can be inside a query at once. Live comment streams
+# (GET /comments/<lesson_id>/stream) are only served in this mode.
+
+import os
+
+SERVER_MODE = os.getenv("SERVER_MODE", "sync")
+
+if SERVER_MODE == "async":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", "200"))
+
+
+def post_fork(server, worker):
+    if SERVER_MODE == "async":
+        return  # see post_worker_init: db must be imported after gevent patches the worker
+    # Each worker needs its own database connections; sockets opened in the
+    # master (e.g. with --preload) must never be shared across processes.
+    import db
+    db.after_fork()
+
+
+def post_worker_init(worker):
+    if SERVER_MODE != "async":
+        return
+    import db
+    db.use_green_connections()
+    db.after_fork()
+
+
+def worker_exit(server, worker):
+    # Commit comments still queued by the group-commit writer (COMMENT_WRITES=batched)
+    import comment_writer
+    comment_writer.writer.drain()
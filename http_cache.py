@@ -0,0 +1,92 @@
+# backend/http_cache.py
+#
+# Conditional GET for the course catalog. Every cacheable resource has a
+# content version in the content_versions table ("catalog" for the course
+# list, "course:<id>" for a course's lessons) that writes bump in the same
+# transaction. The version forms a strong ETag; workers keep versions in
+# memory for VERSION_TTL seconds so a matching If-None-Match gets a 304
+# without touching the database.
+
+import functools
+import hashlib
+import os
+
+from flask import make_response, request
+
+from cache import LRUCache
+from compression import ETAG_SUFFIXES
+from db import DIALECT, get_db
+
+VERSION_TTL = float(os.getenv("CONTENT_VERSION_TTL", "5"))
+CDN_MAX_AGE = int(os.getenv("CATALOG_CDN_MAX_AGE", "30"))
+
+CACHE_CONTROL = f"public, max-age=0, s-maxage={CDN_MAX_AGE}, must-revalidate"
+
+_versions = LRUCache(maxsize=4096, ttl=VERSION_TTL)
+
+
+def bump_version(cursor, *keys):
+    # Call inside the writing transaction, before commit
+    if DIALECT == "sqlite":
+        cursor.executemany("""
+            INSERT INTO content_versions (key, version) VALUES (%s, 1)
+            ON CONFLICT (key) DO UPDATE SET version = content_versions.version + 1
+        """, [(key,) for key in keys])
+    else:
+        cursor.execute("""
+            INSERT INTO content_versions (key, version)
+            SELECT key, 1 FROM unnest(%s::TEXT[]) AS key
+            ON CONFLICT (key) DO UPDATE SET version = content_versions.version + 1
+        """, (list(keys),))
+    for key in keys:
+        _versions.pop(key)
+
+
+def content_version(key):
+    version = _versions.get(key)
+    if version is None:
+        cursor = get_db().cursor()
+        cursor.execute("SELECT version FROM content_versions WHERE key = %s", (key,))
+        row = cursor.fetchone()
+        cursor.close()
+        version = row[0] if row else 0
+        _versions.set(key, version)
+    return version
+
+
+def make_etag(key):
+    # Different query strings (pages, projections) are different representations
+    variant = hashlib.sha1(request.query_string).hexdigest()[:12] if request.query_string else "all"
+    return f"{key.replace(':', '-')}-v{content_version(key)}-{variant}"
+
+
+def _matching_etag(etag):
+    # A compressed response carried the ETag plus a coding suffix
+    for candidate in [etag] + [etag + suffix for suffix in ETAG_SUFFIXES.values()]:
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def conditional(key_for):
+    # Decorator: key_for receives the view's URL arguments and returns the
+    # content version key, e.g. lambda course_id: f"course:{course_id}".
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(key_for(*args, **kwargs))
+
+            matched = _matching_etag(etag)
+            if matched:
+                response = make_response("", 304)
+                response.set_etag(matched)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
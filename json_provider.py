@@ -0,0 +1,64 @@
+# backend/json_provider.py
+#
+# Flask JSON provider backed by orjson. orjson encodes the row-shaped
+# payloads these routes return several times faster than the stdlib and
+# writes datetimes (comments.timestamp) natively as RFC 3339 strings.
+# Select with JSON_PROVIDER=orjson|default; falls back to Flask's provider
+# when orjson is not installed.
+
+import decimal
+import os
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(value):
+    # Types orjson leaves to us; mirrors Flask's defaults
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    if isinstance(value, memoryview):
+        return value.tobytes().decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    # Key order carries no meaning for our clients; skipping the sort is free speed
+    sort_keys = False
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {"default", "separators", "indent", "sort_keys", "ensure_ascii"}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options(bool(kwargs.get("indent")))).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=_default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    choice = os.getenv("JSON_PROVIDER", "orjson")
+    if choice == "orjson" and orjson is not None:
+        app.json = ORJSONProvider(app)
@@ -0,0 +1,220 @@
+# backend/leaderboards.py
+#
+# Windowed and per-course leaderboards (migration 8). Every points award is
+# appended to points_ledger and added to the current week's and month's
+# leaderboard_windows buckets, overall (course_id 0) and for its course, in
+# the grading transaction (record_points() on Postgres, grading.py on
+# SQLite). Boards then read one bucket through leaderboard_windows_rank_idx;
+# all-time per-course boards read course_progress (see progress.py).
+#
+# Run periodically (e.g. daily) to create upcoming ledger partitions and
+# prune old buckets; rebuild recomputes the buckets from the ledger:
+#
+#     python leaderboards.py maintain
+#     python leaderboards.py rebuild
+
+import argparse
+import datetime
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import DIALECT, connection
+
+WINDOWS = ("week", "month")
+ALL_COURSES = 0
+
+KEEP_WEEKS = int(os.getenv("LEADERBOARD_KEEP_WEEKS", "12"))
+KEEP_MONTHS = int(os.getenv("LEADERBOARD_KEEP_MONTHS", "24"))
+LEDGER_KEEP_MONTHS = int(os.getenv("LEDGER_KEEP_MONTHS", "0"))  # 0 keeps the ledger forever
+LEDGER_PARTITIONS_AHEAD = 2  # months
+
+
+class InvalidBoard(ValueError):
+    pass
+
+
+def _month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def bucket_start(window, day=None):
+    # First day (UTC) of the week (Monday) or month containing day
+    day = day or datetime.datetime.now(datetime.timezone.utc).date()
+    if window == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return _month_start(day)
+
+
+# ----------------------------------------
+# Reading boards
+# ----------------------------------------
+def _source(window, course_id, bucket):
+    # (table, filter, params) for one board
+    if window == "all":
+        return "course_progress", "s.course_id = %s", (course_id,)
+    return ("leaderboard_windows",
+            "s.period = %s AND s.bucket_start = %s AND s.course_id = %s",
+            (window, bucket_start(window, bucket).isoformat(), course_id or ALL_COURSES))
+
+
+def board(cursor, window, course_id=None, bucket=None, limit=50, offset=0):
+    # [(username, points, rank)], rank counting users with strictly more points
+    table, where, params = _source(window, course_id, bucket)
+    cursor.execute(f"""
+        SELECT u.username, s.points FROM {table} s
+        JOIN users u ON u.id = s.user_id
+        WHERE {where} AND s.points > 0
+        ORDER BY s.points DESC, s.user_id
+        LIMIT %s OFFSET %s
+    """, params + (limit, offset))
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table} s WHERE {where} AND s.points > %s", params + (rows[0][1],))
+    rank = 1 + cursor.fetchone()[0]
+    result = []
+    for position, (username, points) in enumerate(rows, start=offset + 1):
+        if result and points != result[-1][1]:
+            rank = position
+        result.append((username, points, rank))
+    return result
+
+
+def rank(cursor, user_id, window, course_id=None, bucket=None):
+    # (points, rank) of one user on a board
+    table, where, params = _source(window, course_id, bucket)
+    cursor.execute(f"SELECT s.points FROM {table} s WHERE {where} AND s.user_id = %s", params + (user_id,))
+    row = cursor.fetchone()
+    points = row[0] if row else 0
+    cursor.execute(f"SELECT COUNT(*) FROM {table} s WHERE {where} AND s.points > %s", params + (points,))
+    return points, 1 + cursor.fetchone()[0]
+
+
+# ----------------------------------------
+# Maintenance
+# ----------------------------------------
+def _partition_name(month):
+    return f"points_ledger_{month:%Y_%m}"
+
+
+def _ensure_partitions(cursor, today, log):
+    # Rows already in the default partition for a new month's range are moved
+    # into it first; ATTACH would refuse otherwise.
+    for ahead in range(LEDGER_PARTITIONS_AHEAD + 1):
+        month = _month_start(today, ahead)
+        name = _partition_name(month)
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is not None:
+            continue
+        low, high = f"{month} 00:00:00+00", f"{_month_start(month, 1)} 00:00:00+00"
+        cursor.execute(f"CREATE TABLE {name} (LIKE points_ledger INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM points_ledger_default
+                WHERE awarded_at >= %s AND awarded_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, (low, high))
+        cursor.execute(f"ALTER TABLE points_ledger ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                       (low, high))
+        log(f"  created partition {name}")
+
+
+def _drop_old_partitions(cursor, cutoff, log):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'points_ledger'::regclass AND c.relname LIKE 'points\\_ledger\\_____\\___'
+    """)
+    for (name,) in cursor.fetchall():
+        if name < _partition_name(cutoff):
+            cursor.execute(f"DROP TABLE {name}")
+            log(f"  dropped partition {name}")
+    cursor.execute("DELETE FROM points_ledger_default WHERE awarded_at < %s", (f"{cutoff} 00:00:00+00",))
+
+
+def maintain(today=None, log=print):
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if DIALECT == "postgres":
+                _ensure_partitions(cursor, today, log)
+            if LEDGER_KEEP_MONTHS:
+                cutoff = _month_start(today, -LEDGER_KEEP_MONTHS)
+                if DIALECT == "postgres":
+                    _drop_old_partitions(cursor, cutoff, log)
+                else:
+                    cursor.execute("DELETE FROM points_ledger WHERE awarded_at < %s", (cutoff.isoformat(),))
+
+            for window, cutoff in (("week", bucket_start("week", today) - datetime.timedelta(weeks=KEEP_WEEKS)),
+                                   ("month", _month_start(today, -KEEP_MONTHS))):
+                cursor.execute("DELETE FROM leaderboard_windows WHERE period = %s AND bucket_start < %s",
+                               (window, cutoff.isoformat()))
+                log(f"  pruned {cursor.rowcount} {window} bucket rows before {cutoff}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+if DIALECT == "sqlite":
+    _TRUNCATE = {
+        "week": "date(awarded_at, '-6 days', 'weekday 1')",
+        "month": "date(awarded_at, 'start of month')",
+    }
+else:
+    _TRUNCATE = {
+        window: f"date_trunc('{window}', awarded_at AT TIME ZONE 'UTC')::DATE" for window in WINDOWS
+    }
+
+
+def rebuild():
+    # Recomputes every bucket still inside the ledger's retention
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM leaderboard_windows")
+            for window in WINDOWS:
+                for course in (str(ALL_COURSES), "course_id"):
+                    cursor.execute(f"""
+                        INSERT INTO leaderboard_windows (period, bucket_start, course_id, user_id, points)
+                        SELECT %s, {_TRUNCATE[window]}, {course}, user_id, SUM(points)
+                        FROM points_ledger
+                        WHERE course_id IS NOT NULL OR {course} = 0
+                        GROUP BY 2, 3, 4
+                    """, (window,))
+            cursor.execute("SELECT COUNT(*) FROM leaderboard_windows")
+            buckets = cursor.fetchone()[0]
+            conn.commit()
+            return buckets
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="leaderboards.py")
+    parser.add_argument("command", choices=["maintain", "rebuild"])
+    args = parser.parse_args(argv)
+
+    if args.command == "maintain":
+        maintain()
+    else:
+        print(f"rebuilt {rebuild()} leaderboard bucket rows from the ledger")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
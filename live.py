@@ -0,0 +1,308 @@
+# backend/live.py
+#
+# Live comment fan-out for GET /comments/<lesson_id>/stream (Server-Sent
+# Events). post_comment publishes each new comment with pg_notify inside
+# its transaction; every worker process holds ONE dedicated LISTEN
+# connection, and a listener thread hands each notification to the
+# in-memory queues of that worker's subscribers for the lesson. An idle
+# viewer therefore costs a queue and a heartbeat, not a database
+# connection or a poll.
+#
+# Streams hold their request open, so they are only served with
+# SERVER_MODE=async (gevent); a sync worker would be pinned by one viewer
+# for SSE_MAX_STREAM_SECONDS. Otherwise the endpoint answers 503 and
+# clients poll /comments. SSE_STREAMS=on enables them on another concurrent
+# server (e.g. the threaded dev server). On SQLite (single node) comments
+# are dispatched in-process only.
+#
+# The same connection also LISTENs for cache invalidations, so per-worker
+# caches (see register_cache) drop an entry on every worker as soon as a
+# write that changes it commits, without a database read per cache hit.
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+import metrics
+from db import DIALECT, connection, get_pool
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "comments"
+INVALIDATE_CHANNEL = "cache_invalidate"
+STREAMS_ENABLED = os.getenv(
+    "SSE_STREAMS", "on" if os.getenv("SERVER_MODE", "sync") == "async" else "off") == "on"
+HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))              # seconds between keepalives
+MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "5000"))   # per worker
+MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "900"))
+RETRY_MS = 3000
+CATCH_UP_LIMIT = 500
+SUBSCRIBER_QUEUE_SIZE = 256
+MAX_NOTIFY_PAYLOAD = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+# Put on a subscriber's queue when it falls too far behind; the stream ends
+# and the client reconnects with Last-Event-ID to catch up from the table.
+_OVERFLOW = object()
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # lesson_id -> set of queues
+        self._count = 0
+        self._listener = None
+        self._pid = None
+        self._listening = None  # pid whose listener currently has LISTEN active
+
+    def subscribe(self, lesson_id):
+        self._ensure_listener()
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._count >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers(f"{self._count} live streams already open")
+            self._subscribers.setdefault(lesson_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, lesson_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(lesson_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[lesson_id]
+
+    def dispatch(self, comment):
+        with self._lock:
+            subscribers = list(self._subscribers.get(comment["lesson_id"], ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(comment)
+            except queue.Full:
+                _drain(subscription)
+                subscription.put_nowait(_OVERFLOW)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._count, "lessons": len(self._subscribers)}
+
+    # ---------- LISTEN connection ----------
+
+    def listening(self):
+        # True while this worker is guaranteed to hear invalidations
+        if DIALECT != "postgres":
+            return True
+        self._ensure_listener()
+        return self._listening == os.getpid()
+
+    def _ensure_listener(self):
+        if DIALECT != "postgres":
+            return
+        listener = self._listener
+        if listener is not None and self._pid == os.getpid() and listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._listener = threading.Thread(target=self._listen, name="comment-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        # Oversized comments are loaded on this same connection, so the
+        # listener never waits on the request pool.
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_pool().connect_kwargs)
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {CHANNEL}; LISTEN {INVALIDATE_CHANNEL}")
+                # Invalidations sent while nobody was listening were missed
+                _clear_caches()
+                self._listening = os.getpid()
+                backoff = 1
+                while True:
+                    readable, _, _ = select.select([conn], [], [], HEARTBEAT)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            if notify.channel == INVALIDATE_CHANNEL:
+                                _evict(notify.payload)
+                            else:
+                                self._deliver(cursor, notify.payload)
+                        except psycopg2.Error:
+                            raise  # the connection may be gone; reconnect
+                        except Exception:
+                            log.exception("dropped %s notification %.200r", notify.channel, notify.payload)
+            except Exception as error:
+                self._listening = None
+                if not isinstance(error, psycopg2.OperationalError):
+                    log.exception("comment listener failed; reconnecting in %ss", backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self._listening = None
+                if conn is not None:
+                    conn.close()
+
+    def _deliver(self, cursor, payload):
+        comment = json.loads(payload)
+        if "text" not in comment:
+            comment = _load_comment(cursor, comment["id"])
+            if comment is None:
+                return
+        self.dispatch(comment)
+
+
+broker = Broker()
+
+metrics.register(metrics.Gauge(
+    "sse_subscribers", "Open live comment streams in this worker.", (),
+    lambda: {(): broker.stats()["subscribers"]},
+))
+
+
+# ---------- Cross-worker cache invalidation ----------
+#
+# A cache registered under a prefix is only served from while listening()
+# holds; writers call invalidate() inside their transaction and every
+# worker evicts the keys when it commits. A reader that filled an entry
+# from a snapshot older than an eviction must not store it, so it compares
+# cache_epoch() from before its query with the value after.
+
+_caches = {}  # prefix -> (cache, key type)
+_epoch = 0    # bumped by the listener thread on every eviction
+
+
+def register_cache(prefix, cache, key_type=str):
+    _caches[prefix] = (cache, key_type)
+
+
+def cache_epoch():
+    return _epoch
+
+
+def invalidate(cursor, prefix, *keys):
+    # SQLite runs in one process, where writers pop their own cache entries
+    if DIALECT != "postgres" or not keys:
+        return
+    cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                   (INVALIDATE_CHANNEL, [f"{prefix}:{key}" for key in keys]))
+
+
+def _evict(payload):
+    global _epoch
+    prefix, _, key = payload.partition(":")
+    cache, key_type = _caches[prefix]
+    _epoch += 1
+    cache.pop(key_type(key))
+
+
+def _clear_caches():
+    global _epoch
+    _epoch += 1
+    for cache, _ in _caches.values():
+        cache.clear()
+
+
+def _drain(subscription):
+    try:
+        while True:
+            subscription.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def _comment(row, lesson_id):
+    comment_id, username, text, posted = row
+    return {"id": comment_id, "lesson_id": lesson_id, "username": username, "text": text,
+            "timestamp": posted.isoformat() if hasattr(posted, "isoformat") else posted}
+
+
+def _load_comment(cursor, comment_id):
+    cursor.execute("SELECT id, username, text, timestamp, lesson_id FROM comments WHERE id = %s", (comment_id,))
+    row = cursor.fetchone()
+    return _comment(row[:4], row[4]) if row else None
+
+
+def publish_comment(cursor, comment_id, lesson_id, username, text, posted):
+    # Call inside the inserting transaction: Postgres delivers on commit,
+    # so listeners never see a comment that was rolled back.
+    publish_comments(cursor, [(comment_id, lesson_id, username, text, posted)])
+
+
+def publish_comments(cursor, rows):
+    # rows of (id, lesson_id, username, text, timestamp); one statement for all
+    comments = [_comment((comment_id, username, text, posted), lesson_id)
+                for comment_id, lesson_id, username, text, posted in rows]
+    if DIALECT != "postgres":
+        for comment in comments:
+            broker.dispatch(comment)
+        return
+    payloads = []
+    for comment in comments:
+        payload = json.dumps(comment, separators=(",", ":"))
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({"id": comment["id"], "lesson_id": comment["lesson_id"]})  # listener loads the row
+        payloads.append(payload)
+    cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (CHANNEL, payloads))
+
+
+def _event(comment):
+    return f"id: {comment['id']}\nevent: comment\ndata: {json.dumps(comment, separators=(',', ':'))}\n\n"
+
+
+def event_stream(lesson_id, subscription, last_id=None):
+    # SSE body. Subscribed before the catch-up query, so nothing committed
+    # in between is missed; notifications for rows the catch-up already sent
+    # are skipped. Live events get no ordering filter: concurrent posts can
+    # commit out of id order, and a lower id arriving late is still new.
+    deadline = time.monotonic() + MAX_STREAM_SECONDS
+    caught_up = set()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_id is not None:
+            with connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT id, username, text, timestamp FROM comments
+                    WHERE lesson_id = %s AND id > %s
+                    ORDER BY id LIMIT %s
+                """, (lesson_id, last_id, CATCH_UP_LIMIT))
+                missed = [_comment(row, lesson_id) for row in cursor.fetchall()]
+                conn.rollback()
+                cursor.close()
+            for comment in missed:
+                caught_up.add(comment["id"])
+                yield _event(comment)
+
+        while time.monotonic() < deadline:
+            try:
+                comment = subscription.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if comment is _OVERFLOW:
+                return
+            if comment["id"] in caught_up:
+                caught_up.discard(comment["id"])
+                continue
+            yield _event(comment)
+    finally:
+        broker.unsubscribe(lesson_id, subscription)
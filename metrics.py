@@ -0,0 +1,212 @@
+# backend/metrics.py
+#
+# Request and query instrumentation, exposed in Prometheus text format on
+# GET /metrics. Records per-route latency, per-request query count / time /
+# rows (from the instrumented cursors in db.py and sqlite_db.py) and
+# connection pool wait time. Requests issuing more than METRICS_MAX_QUERIES
+# statements are counted and logged; with SLOW_QUERY_MS set, slower
+# statements are logged to stderr.
+#
+# Metrics live in process memory, so each gunicorn worker reports its own
+# series; the X-Worker header on /metrics names the pid that answered.
+
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "off")
+MAX_QUERIES = int(os.getenv("METRICS_MAX_QUERIES", "10"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 disables the slow-query log
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+_WORKER = str(os.getpid())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    # Value read at scrape time from a callback returning {labels: value}
+    def __init__(self, name, help_text, labels, read):
+        self.name, self.help, self.label_names, self.read = name, help_text, labels, read
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.read().items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route.",
+                            ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "Database statements issued per request.",
+                            ("route",), buckets=QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram("http_request_db_seconds", "Time spent in database statements per request.",
+                               ("route",))
+QUERY_HEAVY = Counter("http_requests_query_heavy_total",
+                      f"Requests that issued more than {MAX_QUERIES} database statements.", ("route",))
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of individual database statements.", ("route",))
+QUERY_ROWS = Counter("db_query_rows_total", "Rows returned or affected by database statements.", ("route",))
+POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting to check out a pooled connection.")
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Connection checkouts that gave up waiting.")
+
+_registry = [REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_QUERY_TIME, QUERY_HEAVY,
+             QUERY_LATENCY, QUERY_ROWS, POOL_WAIT, POOL_TIMEOUTS]
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+# ----------------------------------------
+# Recording hooks
+# ----------------------------------------
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def observe_query(sql, seconds, rows):
+    if not ENABLED:
+        return
+    in_request = has_request_context()
+    route = _route() if in_request else "<background>"
+    QUERY_LATENCY.observe(seconds, route)
+    if rows and rows > 0:
+        QUERY_ROWS.inc(route, amount=rows)
+    if in_request:
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_seconds = g.get("db_seconds", 0.0) + seconds
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        statement = re.sub(r"\s+", " ", sql if isinstance(sql, str) else sql.decode(errors="replace")).strip()
+        print(f"[slow query] {seconds * 1000:.1f}ms {route}: {statement[:300]}", file=sys.stderr, flush=True)
+
+
+def observe_rows(rows):
+    # For drivers that only know the row count once results are fetched
+    if ENABLED and rows:
+        QUERY_ROWS.inc(_route() if has_request_context() else "<background>", amount=rows)
+
+
+def observe_pool_wait(seconds, timed_out=False):
+    if not ENABLED:
+        return
+    POOL_WAIT.observe(seconds)
+    if timed_out:
+        POOL_TIMEOUTS.inc()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+
+
+def _finish_request(status):
+    if g.get("metrics_recorded") or "request_started" not in g:
+        return
+    g.metrics_recorded = True
+    route = _route()
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, request.method, route, status)
+    queries = g.get("db_queries", 0)
+    REQUEST_QUERIES.observe(queries, route)
+    REQUEST_QUERY_TIME.observe(g.get("db_seconds", 0.0), route)
+    if queries > MAX_QUERIES:
+        QUERY_HEAVY.inc(route)
+        print(f"[query-heavy] {request.method} {request.path} ({route}) issued {queries} queries",
+              file=sys.stderr, flush=True)
+
+
+def _after_request(response):
+    _finish_request(response.status_code)
+    return response
+
+
+def _teardown_request(exc=None):
+    # Unhandled exceptions never reach after_request
+    if exc is not None:
+        _finish_request(500)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    def metrics_endpoint():
+        return Response(render(), mimetype="text/plain", headers={"X-Worker": _WORKER})
+
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
@@ -0,0 +1,1215 @@
+# backend/migrations.py
+#
+# Versioned schema changes. Apply pending migrations with:
+#
+#     python migrations.py            # migrate to the latest version
+#     python migrations.py status     # show current / latest version
+#
+# Workers never run DDL: on boot they only compare the stored version with
+# SCHEMA_VERSION (one small SELECT). Append new migrations to the end of
+# MIGRATIONS and never edit one that has already shipped. Every migration
+# needs a SQLite counterpart with the same version in SQLITE_MIGRATIONS,
+# used when DB_BACKEND=sqlite.
+
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import DIALECT, UndefinedTable, connection
+
+MIGRATIONS = [
+    (1, "baseline schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE,
+            full_name TEXT,
+            password TEXT,
+            role TEXT DEFAULT 'student',
+            total_points INTEGER DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS courses (
+            id SERIAL PRIMARY KEY,
+            title TEXT,
+            description TEXT,
+            language TEXT DEFAULT 'General'
+        );
+
+        CREATE TABLE IF NOT EXISTS lessons (
+            id SERIAL PRIMARY KEY,
+            course_id INTEGER REFERENCES courses(id),
+            title TEXT,
+            video_url TEXT,
+            lesson_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS questions (
+            id SERIAL PRIMARY KEY,
+            lesson_id INTEGER REFERENCES lessons(id),
+            question_text TEXT,
+            correct_answer_id INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS answers (
+            id SERIAL PRIMARY KEY,
+            question_id INTEGER REFERENCES questions(id),
+            answer_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id),
+            is_completed BOOLEAN
+        );
+
+        CREATE TABLE IF NOT EXISTS user_points (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id),
+            points INTEGER,
+            badge TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            user_id INTEGER REFERENCES users(id),
+            question_id INTEGER REFERENCES questions(id),
+            attempts INTEGER DEFAULT 0,
+            is_correct BOOLEAN DEFAULT FALSE
+        );
+
+        CREATE TABLE IF NOT EXISTS comments (
+            id SERIAL PRIMARY KEY,
+            lesson_id INTEGER REFERENCES lessons(id),
+            username TEXT,
+            text TEXT,
+            timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+
+    (2, "atomic answer grading", """
+        -- Merge duplicate attempt rows left by concurrent submissions
+        CREATE TEMP TABLE user_attempts_merged ON COMMIT DROP AS
+            SELECT user_id, question_id,
+                   MAX(attempts) AS attempts, BOOL_OR(is_correct) AS is_correct
+            FROM user_attempts
+            GROUP BY user_id, question_id
+            HAVING COUNT(*) > 1;
+
+        DELETE FROM user_attempts ua
+        USING user_attempts_merged m
+        WHERE ua.user_id = m.user_id AND ua.question_id = m.question_id;
+
+        INSERT INTO user_attempts (user_id, question_id, attempts, is_correct)
+        SELECT user_id, question_id, attempts, is_correct FROM user_attempts_merged;
+
+        ALTER TABLE user_attempts
+            ADD CONSTRAINT user_attempts_user_question_key UNIQUE (user_id, question_id);
+
+        -- One round trip per submission. The upsert takes the row lock, so a
+        -- concurrent double-submit waits and then sees is_correct = TRUE.
+        CREATE OR REPLACE FUNCTION grade_answer(p_username TEXT, p_question_id INTEGER, p_answer_id INTEGER)
+        RETURNS TABLE (outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        DECLARE
+            v_user_id INTEGER;
+            v_correct_answer_id INTEGER;
+            v_is_correct BOOLEAN;
+            v_attempts INTEGER;
+            v_points INTEGER;
+        BEGIN
+            SELECT id INTO v_user_id FROM users WHERE username = p_username;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_user'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT correct_answer_id INTO v_correct_answer_id FROM questions WHERE id = p_question_id;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_question'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            v_is_correct := p_answer_id IS NOT DISTINCT FROM v_correct_answer_id;
+
+            INSERT INTO user_attempts AS ua (user_id, question_id, attempts, is_correct)
+            VALUES (v_user_id, p_question_id, 1, v_is_correct)
+            ON CONFLICT (user_id, question_id) DO UPDATE
+                SET attempts = COALESCE(ua.attempts, 0) + 1,
+                    is_correct = EXCLUDED.is_correct
+                WHERE NOT COALESCE(ua.is_correct, FALSE)
+            RETURNING ua.attempts INTO v_attempts;
+
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'already_correct'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            IF NOT v_is_correct THEN
+                RETURN QUERY SELECT 'incorrect'::TEXT, v_attempts, 0;
+                RETURN;
+            END IF;
+
+            v_points := CASE v_attempts WHEN 1 THEN 10 WHEN 2 THEN 7 WHEN 3 THEN 5 ELSE 0 END;
+            UPDATE users SET total_points = COALESCE(total_points, 0) + v_points WHERE id = v_user_id;
+            RETURN QUERY SELECT 'correct'::TEXT, v_attempts, v_points;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+
+    (3, "leaderboard index and score histogram", """
+        UPDATE users SET total_points = 0 WHERE total_points IS NULL;
+        ALTER TABLE users ALTER COLUMN total_points SET NOT NULL;
+
+        CREATE INDEX IF NOT EXISTS users_total_points_idx ON users (total_points DESC, id);
+
+        -- Rank snapshot: how many users hold each score. A user's rank is
+        -- 1 + the number of users in higher buckets, so rank lookups read a
+        -- handful of bucket rows instead of counting users.
+        CREATE TABLE IF NOT EXISTS leaderboard_scores (
+            total_points INTEGER PRIMARY KEY,
+            user_count INTEGER NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO leaderboard_scores (total_points, user_count)
+        SELECT total_points, COUNT(*) FROM users GROUP BY total_points
+        ON CONFLICT (total_points) DO UPDATE SET user_count = EXCLUDED.user_count;
+
+        CREATE OR REPLACE FUNCTION leaderboard_scores_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE leaderboard_scores SET user_count = user_count - 1
+                WHERE total_points = OLD.total_points;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                INSERT INTO leaderboard_scores (total_points, user_count)
+                VALUES (NEW.total_points, 1)
+                ON CONFLICT (total_points) DO UPDATE
+                    SET user_count = leaderboard_scores.user_count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER users_leaderboard_scores_rows
+        AFTER INSERT OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION leaderboard_scores_sync();
+
+        -- Fires when grade_answer awards points
+        CREATE TRIGGER users_leaderboard_scores_points
+        AFTER UPDATE OF total_points ON users
+        FOR EACH ROW WHEN (OLD.total_points IS DISTINCT FROM NEW.total_points)
+        EXECUTE FUNCTION leaderboard_scores_sync();
+    """),
+
+    (4, "indexes for route lookups", """
+        -- Shapes issued by the routes; see bench/explain_check.py
+        CREATE INDEX IF NOT EXISTS lessons_course_id_idx ON lessons (course_id, id);
+        CREATE INDEX IF NOT EXISTS questions_lesson_id_idx ON questions (lesson_id, id);
+        CREATE INDEX IF NOT EXISTS answers_question_id_idx ON answers (question_id, id);
+        CREATE INDEX IF NOT EXISTS user_attempts_question_id_idx ON user_attempts (question_id);
+        CREATE INDEX IF NOT EXISTS comments_lesson_timestamp_idx ON comments (lesson_id, timestamp DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS user_progress_lesson_id_idx ON user_progress (lesson_id);
+        CREATE INDEX IF NOT EXISTS user_points_lesson_id_idx ON user_points (lesson_id);
+        -- user_attempts (user_id, question_id) is covered by its unique key
+    """),
+
+    (5, "cascade course content deletes", """
+        -- Deleting a course, lesson or question removes everything under it
+        -- in one statement, including answers and attempts.
+        ALTER TABLE lessons
+            DROP CONSTRAINT IF EXISTS lessons_course_id_fkey,
+            ADD CONSTRAINT lessons_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE;
+        ALTER TABLE questions
+            DROP CONSTRAINT IF EXISTS questions_lesson_id_fkey,
+            ADD CONSTRAINT questions_lesson_id_fkey FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE;
+        ALTER TABLE answers
+            DROP CONSTRAINT IF EXISTS answers_question_id_fkey,
+            ADD CONSTRAINT answers_question_id_fkey FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE;
+        ALTER TABLE user_attempts
+            DROP CONSTRAINT IF EXISTS user_attempts_question_id_fkey,
+            ADD CONSTRAINT user_attempts_question_id_fkey FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE;
+        ALTER TABLE user_progress
+            DROP CONSTRAINT IF EXISTS user_progress_lesson_id_fkey,
+            ADD CONSTRAINT user_progress_lesson_id_fkey FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE;
+        ALTER TABLE user_points
+            DROP CONSTRAINT IF EXISTS user_points_lesson_id_fkey,
+            ADD CONSTRAINT user_points_lesson_id_fkey FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE;
+        ALTER TABLE comments
+            DROP CONSTRAINT IF EXISTS comments_lesson_id_fkey,
+            ADD CONSTRAINT comments_lesson_id_fkey FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE;
+    """),
+
+    (6, "content versions for catalog ETags", """
+        -- Bumped by catalog writes; see http_cache.py
+        CREATE TABLE IF NOT EXISTS content_versions (
+            key TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1
+        );
+    """),
+    (7, "incremental progress rollups", """
+        -- Denominators for progress percentages, kept by triggers on questions
+        -- and lessons. quiz_lesson_count counts lessons with at least one question.
+        ALTER TABLE lessons ADD COLUMN IF NOT EXISTS question_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE courses
+            ADD COLUMN IF NOT EXISTS question_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS quiz_lesson_count INTEGER NOT NULL DEFAULT 0;
+
+        UPDATE lessons SET question_count = (SELECT COUNT(*) FROM questions q WHERE q.lesson_id = lessons.id);
+        UPDATE courses SET
+            question_count = (SELECT COALESCE(SUM(l.question_count), 0) FROM lessons l WHERE l.course_id = courses.id),
+            quiz_lesson_count = (SELECT COUNT(*) FROM lessons l WHERE l.course_id = courses.id AND l.question_count > 0);
+
+        CREATE OR REPLACE FUNCTION question_counts_sync() RETURNS trigger AS $$
+        DECLARE
+            v_lesson_id INTEGER;
+            v_delta INTEGER;
+            v_course_id INTEGER;
+            v_count INTEGER;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                v_lesson_id := NEW.lesson_id;
+                v_delta := 1;
+            ELSE
+                v_lesson_id := OLD.lesson_id;
+                v_delta := -1;
+            END IF;
+            -- Not found when the lesson itself is being deleted; see lesson_counts_sync
+            UPDATE lessons SET question_count = question_count + v_delta WHERE id = v_lesson_id
+            RETURNING course_id, question_count INTO v_course_id, v_count;
+            IF FOUND THEN
+                UPDATE courses SET
+                    question_count = question_count + v_delta,
+                    quiz_lesson_count = quiz_lesson_count + CASE
+                        WHEN v_delta = 1 AND v_count = 1 THEN 1
+                        WHEN v_delta = -1 AND v_count = 0 THEN -1
+                        ELSE 0 END
+                WHERE id = v_course_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION lesson_counts_sync() RETURNS trigger AS $$
+        BEGIN
+            UPDATE courses SET
+                question_count = question_count - OLD.question_count,
+                quiz_lesson_count = quiz_lesson_count - CASE WHEN OLD.question_count > 0 THEN 1 ELSE 0 END
+            WHERE id = OLD.course_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER questions_counts_rows
+        AFTER INSERT OR DELETE ON questions
+        FOR EACH ROW EXECUTE FUNCTION question_counts_sync();
+
+        CREATE TRIGGER lessons_counts_rows
+        AFTER DELETE ON lessons
+        FOR EACH ROW EXECUTE FUNCTION lesson_counts_sync();
+
+        -- user_progress and user_points were never written; they become the
+        -- per-lesson rollups. migrate() refills them from user_attempts with
+        -- progress.backfill() once this commits.
+        DELETE FROM user_progress;
+        DELETE FROM user_points;
+        ALTER TABLE user_progress
+            ADD COLUMN IF NOT EXISTS questions_correct INTEGER NOT NULL DEFAULT 0,
+            ADD CONSTRAINT user_progress_user_lesson_key UNIQUE (user_id, lesson_id);
+        ALTER TABLE user_points
+            ALTER COLUMN points SET DEFAULT 0,
+            ADD CONSTRAINT user_points_user_lesson_key UNIQUE (user_id, lesson_id);
+
+        CREATE TABLE IF NOT EXISTS course_progress (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+            lessons_completed INTEGER NOT NULL DEFAULT 0,
+            questions_correct INTEGER NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0,
+            badge TEXT,
+            PRIMARY KEY (user_id, course_id)
+        );
+        CREATE INDEX IF NOT EXISTS course_progress_course_id_idx ON course_progress (course_id);
+
+        -- Badge once every question is answered: gold if all were right on
+        -- the first try, silver for an average of a second try, else bronze.
+        -- Same thresholds as grading.BADGES.
+        CREATE OR REPLACE FUNCTION progress_badge(p_points INTEGER, p_correct INTEGER, p_questions INTEGER)
+        RETURNS TEXT AS $$
+            SELECT CASE
+                WHEN p_questions = 0 OR p_correct < p_questions THEN NULL
+                WHEN p_points >= 10 * p_questions THEN 'gold'
+                WHEN p_points >= 7 * p_questions THEN 'silver'
+                ELSE 'bronze' END;
+        $$ LANGUAGE sql IMMUTABLE;
+
+        -- Called by grade_answer for every correct answer
+        CREATE OR REPLACE FUNCTION record_progress(p_user_id INTEGER, p_lesson_id INTEGER, p_points INTEGER)
+        RETURNS VOID AS $$
+        DECLARE
+            v_course_id INTEGER;
+            v_questions INTEGER;
+            v_course_questions INTEGER;
+            v_correct INTEGER;
+        BEGIN
+            SELECT l.course_id, l.question_count, c.question_count
+            INTO v_course_id, v_questions, v_course_questions
+            FROM lessons l LEFT JOIN courses c ON c.id = l.course_id
+            WHERE l.id = p_lesson_id;
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO user_progress AS up (user_id, lesson_id, questions_correct, is_completed)
+            VALUES (p_user_id, p_lesson_id, 1, 1 >= v_questions)
+            ON CONFLICT (user_id, lesson_id) DO UPDATE
+                SET questions_correct = up.questions_correct + 1,
+                    is_completed = up.questions_correct + 1 >= v_questions
+            RETURNING up.questions_correct INTO v_correct;
+
+            INSERT INTO user_points AS pt (user_id, lesson_id, points, badge)
+            VALUES (p_user_id, p_lesson_id, p_points, progress_badge(p_points, v_correct, v_questions))
+            ON CONFLICT (user_id, lesson_id) DO UPDATE
+                SET points = pt.points + p_points,
+                    badge = progress_badge(pt.points + p_points, v_correct, v_questions);
+
+            IF v_course_id IS NULL THEN
+                RETURN;
+            END IF;
+
+            -- The lesson was completed by exactly this answer when the count
+            -- just reached the number of questions
+            INSERT INTO course_progress AS cp (user_id, course_id, lessons_completed, questions_correct, points, badge)
+            VALUES (p_user_id, v_course_id, CASE WHEN v_correct = v_questions THEN 1 ELSE 0 END, 1, p_points,
+                    progress_badge(p_points, 1, v_course_questions))
+            ON CONFLICT (user_id, course_id) DO UPDATE
+                SET lessons_completed = cp.lessons_completed + EXCLUDED.lessons_completed,
+                    questions_correct = cp.questions_correct + 1,
+                    points = cp.points + p_points,
+                    badge = progress_badge(cp.points + p_points, cp.questions_correct + 1, v_course_questions);
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION grade_answer(p_username TEXT, p_question_id INTEGER, p_answer_id INTEGER)
+        RETURNS TABLE (outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        DECLARE
+            v_user_id INTEGER;
+            v_correct_answer_id INTEGER;
+            v_lesson_id INTEGER;
+            v_is_correct BOOLEAN;
+            v_attempts INTEGER;
+            v_points INTEGER;
+        BEGIN
+            SELECT id INTO v_user_id FROM users WHERE username = p_username;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_user'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT correct_answer_id, lesson_id INTO v_correct_answer_id, v_lesson_id
+            FROM questions WHERE id = p_question_id;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_question'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            v_is_correct := p_answer_id IS NOT DISTINCT FROM v_correct_answer_id;
+
+            INSERT INTO user_attempts AS ua (user_id, question_id, attempts, is_correct)
+            VALUES (v_user_id, p_question_id, 1, v_is_correct)
+            ON CONFLICT (user_id, question_id) DO UPDATE
+                SET attempts = COALESCE(ua.attempts, 0) + 1,
+                    is_correct = EXCLUDED.is_correct
+                WHERE NOT COALESCE(ua.is_correct, FALSE)
+            RETURNING ua.attempts INTO v_attempts;
+
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'already_correct'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            IF NOT v_is_correct THEN
+                RETURN QUERY SELECT 'incorrect'::TEXT, v_attempts, 0;
+                RETURN;
+            END IF;
+
+            v_points := CASE v_attempts WHEN 1 THEN 10 WHEN 2 THEN 7 WHEN 3 THEN 5 ELSE 0 END;
+            UPDATE users SET total_points = COALESCE(total_points, 0) + v_points WHERE id = v_user_id;
+            IF v_lesson_id IS NOT NULL THEN
+                PERFORM record_progress(v_user_id, v_lesson_id, v_points);
+            END IF;
+            RETURN QUERY SELECT 'correct'::TEXT, v_attempts, v_points;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+    (8, "points ledger and windowed leaderboards", """
+        -- Append-only record of every points award, written by grade_answer in
+        -- the awarding transaction. Range partitioned by month; partitions
+        -- are created (and old ones dropped) by `python leaderboards.py
+        -- maintain`, anything outside them lands in the default partition.
+        CREATE TABLE IF NOT EXISTS points_ledger (
+            id BIGINT GENERATED ALWAYS AS IDENTITY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            question_id INTEGER,  -- no foreign keys: history outlives deleted content
+            course_id INTEGER,
+            points INTEGER NOT NULL,
+            awarded_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (awarded_at, id)
+        ) PARTITION BY RANGE (awarded_at);
+        CREATE TABLE IF NOT EXISTS points_ledger_default PARTITION OF points_ledger DEFAULT;
+        CREATE INDEX IF NOT EXISTS points_ledger_user_idx ON points_ledger (user_id, awarded_at);
+
+        -- Points per user per UTC week (from Monday) and month, overall
+        -- (course_id 0) and per course. Old buckets are pruned by maintain.
+        CREATE TABLE IF NOT EXISTS leaderboard_windows (
+            period TEXT NOT NULL,
+            bucket_start DATE NOT NULL,
+            course_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, course_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS leaderboard_windows_rank_idx
+            ON leaderboard_windows (period, bucket_start, course_id, points DESC, user_id);
+
+        -- All-time per-course boards read course_progress directly
+        CREATE INDEX IF NOT EXISTS course_progress_points_idx ON course_progress (course_id, points DESC, user_id);
+        DROP INDEX IF EXISTS course_progress_course_id_idx;
+
+        CREATE OR REPLACE FUNCTION record_points(p_user_id INTEGER, p_question_id INTEGER,
+                                                 p_course_id INTEGER, p_points INTEGER)
+        RETURNS VOID AS $$
+        DECLARE
+            v_day DATE := (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::DATE;
+        BEGIN
+            INSERT INTO points_ledger (user_id, question_id, course_id, points)
+            VALUES (p_user_id, p_question_id, p_course_id, p_points);
+
+            INSERT INTO leaderboard_windows AS w (period, bucket_start, course_id, user_id, points)
+            SELECT b.period, b.bucket_start, c.course_id, p_user_id, p_points
+            FROM (VALUES ('week', date_trunc('week', v_day)::DATE),
+                         ('month', date_trunc('month', v_day)::DATE)) AS b (period, bucket_start)
+            CROSS JOIN (SELECT 0 UNION ALL SELECT p_course_id WHERE p_course_id IS NOT NULL) AS c (course_id)
+            ON CONFLICT (period, bucket_start, course_id, user_id) DO UPDATE
+                SET points = w.points + EXCLUDED.points;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION grade_answer(p_username TEXT, p_question_id INTEGER, p_answer_id INTEGER)
+        RETURNS TABLE (outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        DECLARE
+            v_user_id INTEGER;
+            v_correct_answer_id INTEGER;
+            v_lesson_id INTEGER;
+            v_course_id INTEGER;
+            v_is_correct BOOLEAN;
+            v_attempts INTEGER;
+            v_points INTEGER;
+        BEGIN
+            SELECT id INTO v_user_id FROM users WHERE username = p_username;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_user'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT q.correct_answer_id, q.lesson_id, l.course_id
+            INTO v_correct_answer_id, v_lesson_id, v_course_id
+            FROM questions q LEFT JOIN lessons l ON l.id = q.lesson_id
+            WHERE q.id = p_question_id;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_question'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            v_is_correct := p_answer_id IS NOT DISTINCT FROM v_correct_answer_id;
+
+            INSERT INTO user_attempts AS ua (user_id, question_id, attempts, is_correct)
+            VALUES (v_user_id, p_question_id, 1, v_is_correct)
+            ON CONFLICT (user_id, question_id) DO UPDATE
+                SET attempts = COALESCE(ua.attempts, 0) + 1,
+                    is_correct = EXCLUDED.is_correct
+                WHERE NOT COALESCE(ua.is_correct, FALSE)
+            RETURNING ua.attempts INTO v_attempts;
+
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'already_correct'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            IF NOT v_is_correct THEN
+                RETURN QUERY SELECT 'incorrect'::TEXT, v_attempts, 0;
+                RETURN;
+            END IF;
+
+            v_points := CASE v_attempts WHEN 1 THEN 10 WHEN 2 THEN 7 WHEN 3 THEN 5 ELSE 0 END;
+            UPDATE users SET total_points = COALESCE(total_points, 0) + v_points WHERE id = v_user_id;
+            IF v_lesson_id IS NOT NULL THEN
+                PERFORM record_progress(v_user_id, v_lesson_id, v_points);
+            END IF;
+            IF v_points > 0 THEN
+                PERFORM record_points(v_user_id, p_question_id, v_course_id, v_points);
+            END IF;
+            RETURN QUERY SELECT 'correct'::TEXT, v_attempts, v_points;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+    (9, "whole-quiz grading", """
+        -- Grades one answer once the user and question are known: attempt
+        -- upsert, then progress rollups and the points ledger when correct.
+        -- Callers add points_awarded to users.total_points themselves, so a
+        -- whole quiz updates the user row (and leaderboard histogram) once.
+        CREATE OR REPLACE FUNCTION grade_attempt(p_user_id INTEGER, p_question_id INTEGER,
+                                                 p_correct_answer_id INTEGER, p_lesson_id INTEGER,
+                                                 p_course_id INTEGER, p_answer_id INTEGER)
+        RETURNS TABLE (outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        DECLARE
+            v_is_correct BOOLEAN;
+            v_attempts INTEGER;
+            v_points INTEGER;
+        BEGIN
+            v_is_correct := p_answer_id IS NOT DISTINCT FROM p_correct_answer_id;
+
+            INSERT INTO user_attempts AS ua (user_id, question_id, attempts, is_correct)
+            VALUES (p_user_id, p_question_id, 1, v_is_correct)
+            ON CONFLICT (user_id, question_id) DO UPDATE
+                SET attempts = COALESCE(ua.attempts, 0) + 1,
+                    is_correct = EXCLUDED.is_correct
+                WHERE NOT COALESCE(ua.is_correct, FALSE)
+            RETURNING ua.attempts INTO v_attempts;
+
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'already_correct'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            IF NOT v_is_correct THEN
+                RETURN QUERY SELECT 'incorrect'::TEXT, v_attempts, 0;
+                RETURN;
+            END IF;
+
+            v_points := CASE v_attempts WHEN 1 THEN 10 WHEN 2 THEN 7 WHEN 3 THEN 5 ELSE 0 END;
+            IF p_lesson_id IS NOT NULL THEN
+                PERFORM record_progress(p_user_id, p_lesson_id, v_points);
+            END IF;
+            IF v_points > 0 THEN
+                PERFORM record_points(p_user_id, p_question_id, p_course_id, v_points);
+            END IF;
+            RETURN QUERY SELECT 'correct'::TEXT, v_attempts, v_points;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- The user row is locked first, so one user's submissions (single or
+        -- whole-quiz) serialize there instead of deadlocking on each other.
+        CREATE OR REPLACE FUNCTION grade_answer(p_username TEXT, p_question_id INTEGER, p_answer_id INTEGER)
+        RETURNS TABLE (outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        DECLARE
+            v_user_id INTEGER;
+            v_question RECORD;
+            v_result RECORD;
+        BEGIN
+            SELECT id INTO v_user_id FROM users WHERE username = p_username FOR NO KEY UPDATE;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_user'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT q.correct_answer_id, q.lesson_id, l.course_id INTO v_question
+            FROM questions q LEFT JOIN lessons l ON l.id = q.lesson_id
+            WHERE q.id = p_question_id;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT 'no_question'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT * INTO v_result FROM grade_attempt(v_user_id, p_question_id, v_question.correct_answer_id,
+                                                      v_question.lesson_id, v_question.course_id, p_answer_id);
+            IF v_result.points_awarded > 0 THEN
+                UPDATE users SET total_points = COALESCE(total_points, 0) + v_result.points_awarded WHERE id = v_user_id;
+            END IF;
+            RETURN QUERY SELECT v_result.outcome, v_result.attempt_count, v_result.points_awarded;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Grades every answer for one lesson in one call. Correct answers are
+        -- loaded with a single query; answers run in question order (ties in
+        -- submission order) so concurrent submissions lock rows in the same
+        -- order. item is the answer's 1-based position in the arrays; a single
+        -- row with outcome no_user means the user does not exist.
+        CREATE OR REPLACE FUNCTION grade_quiz(p_username TEXT, p_lesson_id INTEGER,
+                                              p_question_ids INTEGER[], p_answer_ids INTEGER[])
+        RETURNS TABLE (item INTEGER, question_id INTEGER, outcome TEXT, attempt_count INTEGER, points_awarded INTEGER) AS $$
+        #variable_conflict use_column
+        DECLARE
+            v_user_id INTEGER;
+            v_course_id INTEGER;
+            v_total INTEGER := 0;
+            v_answer RECORD;
+            v_result RECORD;
+        BEGIN
+            SELECT id INTO v_user_id FROM users WHERE username = p_username FOR NO KEY UPDATE;
+            IF NOT FOUND THEN
+                RETURN QUERY SELECT NULL::INTEGER, NULL::INTEGER, 'no_user'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                RETURN;
+            END IF;
+
+            SELECT course_id INTO v_course_id FROM lessons WHERE id = p_lesson_id;
+
+            FOR v_answer IN
+                SELECT a.ord::INTEGER AS ord, a.qid, a.aid, q.id IS NOT NULL AS in_lesson, q.correct_answer_id
+                FROM unnest(p_question_ids, p_answer_ids) WITH ORDINALITY AS a (qid, aid, ord)
+                LEFT JOIN questions q ON q.id = a.qid AND q.lesson_id = p_lesson_id
+                ORDER BY a.qid, a.ord
+            LOOP
+                IF NOT v_answer.in_lesson THEN
+                    RETURN QUERY SELECT v_answer.ord, v_answer.qid, 'no_question'::TEXT, NULL::INTEGER, NULL::INTEGER;
+                    CONTINUE;
+                END IF;
+                SELECT * INTO v_result FROM grade_attempt(v_user_id, v_answer.qid, v_answer.correct_answer_id,
+                                                          p_lesson_id, v_course_id, v_answer.aid);
+                v_total := v_total + COALESCE(v_result.points_awarded, 0);
+                RETURN QUERY SELECT v_answer.ord, v_answer.qid, v_result.outcome,
+                                    v_result.attempt_count, v_result.points_awarded;
+            END LOOP;
+
+            IF v_total > 0 THEN
+                UPDATE users SET total_points = COALESCE(total_points, 0) + v_total WHERE id = v_user_id;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+    (10, "sharded score histogram", """
+        -- Every registration and every points award moved a user between
+        -- two leaderboard_scores rows, so all of them serialized on the few
+        -- rows holding common low scores (every new user hits score 0).
+        -- Each score now has up to 16 rows, picked by user id; readers sum
+        -- them. Moves still lock in ascending score order within a shard.
+        -- The users lock waits out in-flight grading and holds new grading
+        -- back until the histogram is rebuilt under the new trigger.
+        LOCK TABLE users IN SHARE MODE;
+
+        ALTER TABLE leaderboard_scores DROP CONSTRAINT leaderboard_scores_pkey;
+        ALTER TABLE leaderboard_scores ADD COLUMN shard SMALLINT NOT NULL DEFAULT 0;
+        DELETE FROM leaderboard_scores;
+        INSERT INTO leaderboard_scores (total_points, shard, user_count)
+        SELECT total_points, id % 16, COUNT(*) FROM users GROUP BY 1, 2;
+        ALTER TABLE leaderboard_scores ADD PRIMARY KEY (total_points, shard);
+
+        CREATE OR REPLACE FUNCTION leaderboard_scores_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE leaderboard_scores SET user_count = user_count - 1
+                WHERE total_points = OLD.total_points AND shard = OLD.id % 16;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                INSERT INTO leaderboard_scores (total_points, shard, user_count)
+                VALUES (NEW.total_points, NEW.id % 16, 1)
+                ON CONFLICT (total_points, shard) DO UPDATE
+                    SET user_count = leaderboard_scores.user_count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+
+    (11, "cascade user deletes", """
+        -- Deleting a user removes their attempts and progress rollups in the
+        -- same statement, like the ledger and course_progress already do.
+        ALTER TABLE user_attempts
+            DROP CONSTRAINT IF EXISTS user_attempts_user_id_fkey,
+            ADD CONSTRAINT user_attempts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+        ALTER TABLE user_progress
+            DROP CONSTRAINT IF EXISTS user_progress_user_id_fkey,
+            ADD CONSTRAINT user_progress_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+        ALTER TABLE user_points
+            DROP CONSTRAINT IF EXISTS user_points_user_id_fkey,
+            ADD CONSTRAINT user_points_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+    """),
+]
+
+SQLITE_MIGRATIONS = [
+    (1, "baseline schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            full_name TEXT,
+            password TEXT,
+            role TEXT DEFAULT 'student',
+            total_points INTEGER DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            description TEXT,
+            language TEXT DEFAULT 'General'
+        );
+
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER REFERENCES courses(id),
+            title TEXT,
+            video_url TEXT,
+            lesson_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER REFERENCES lessons(id),
+            question_text TEXT,
+            correct_answer_id INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER REFERENCES questions(id),
+            answer_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id),
+            is_completed BOOLEAN
+        );
+
+        CREATE TABLE IF NOT EXISTS user_points (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id),
+            points INTEGER,
+            badge TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            user_id INTEGER REFERENCES users(id),
+            question_id INTEGER REFERENCES questions(id),
+            attempts INTEGER DEFAULT 0,
+            is_correct BOOLEAN DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER REFERENCES lessons(id),
+            username TEXT,
+            text TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+
+    (2, "atomic answer grading", """
+        CREATE TEMP TABLE user_attempts_merged AS
+            SELECT user_id, question_id, MAX(attempts) AS attempts, MAX(is_correct) AS is_correct
+            FROM user_attempts
+            GROUP BY user_id, question_id
+            HAVING COUNT(*) > 1;
+
+        DELETE FROM user_attempts
+        WHERE (user_id, question_id) IN (SELECT user_id, question_id FROM user_attempts_merged);
+
+        INSERT INTO user_attempts (user_id, question_id, attempts, is_correct)
+        SELECT user_id, question_id, attempts, is_correct FROM user_attempts_merged;
+
+        DROP TABLE user_attempts_merged;
+
+        CREATE UNIQUE INDEX user_attempts_user_question_key ON user_attempts (user_id, question_id);
+        -- grade_answer() itself lives in grading.py on SQLite
+    """),
+
+    (3, "leaderboard index and score histogram", """
+        -- SQLite cannot add NOT NULL to an existing column; new users get the default 0
+        UPDATE users SET total_points = 0 WHERE total_points IS NULL;
+
+        CREATE INDEX IF NOT EXISTS users_total_points_idx ON users (total_points DESC, id);
+
+        CREATE TABLE IF NOT EXISTS leaderboard_scores (
+            total_points INTEGER PRIMARY KEY,
+            user_count INTEGER NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO leaderboard_scores (total_points, user_count)
+        SELECT total_points, COUNT(*) FROM users WHERE TRUE GROUP BY total_points
+        ON CONFLICT (total_points) DO UPDATE SET user_count = excluded.user_count;
+
+        CREATE TRIGGER users_leaderboard_scores_insert
+        AFTER INSERT ON users
+        BEGIN
+            INSERT INTO leaderboard_scores (total_points, user_count) VALUES (NEW.total_points, 1)
+            ON CONFLICT (total_points) DO UPDATE SET user_count = user_count + 1;
+        END;
+
+        CREATE TRIGGER users_leaderboard_scores_delete
+        AFTER DELETE ON users
+        BEGIN
+            UPDATE leaderboard_scores SET user_count = user_count - 1 WHERE total_points = OLD.total_points;
+        END;
+
+        CREATE TRIGGER users_leaderboard_scores_points
+        AFTER UPDATE OF total_points ON users
+        WHEN OLD.total_points IS NOT NEW.total_points
+        BEGIN
+            UPDATE leaderboard_scores SET user_count = user_count - 1 WHERE total_points = OLD.total_points;
+            INSERT INTO leaderboard_scores (total_points, user_count) VALUES (NEW.total_points, 1)
+            ON CONFLICT (total_points) DO UPDATE SET user_count = user_count + 1;
+        END;
+    """),
+
+    (4, "indexes for route lookups", MIGRATIONS[3][2]),
+
+    (5, "cascade course content deletes", """
+        -- SQLite cannot alter a foreign key, so every referencing table is
+        -- rebuilt; migrate() disables foreign key enforcement around this.
+        -- Rows whose parent is already gone (the old schema never enforced
+        -- its keys) are dropped, and AUTOINCREMENT counters are carried over
+        -- so deleted ids are not handed out again.
+        CREATE TEMP TABLE saved_sequences AS SELECT name, seq FROM sqlite_sequence;
+
+        CREATE TABLE lessons_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+            title TEXT,
+            video_url TEXT,
+            lesson_text TEXT
+        );
+        INSERT INTO lessons_new SELECT id, course_id, title, video_url, lesson_text FROM lessons
+            WHERE course_id IS NULL OR course_id IN (SELECT id FROM courses);
+        DROP TABLE lessons;
+        ALTER TABLE lessons_new RENAME TO lessons;
+        CREATE INDEX lessons_course_id_idx ON lessons (course_id, id);
+
+        CREATE TABLE questions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            question_text TEXT,
+            correct_answer_id INTEGER
+        );
+        INSERT INTO questions_new SELECT id, lesson_id, question_text, correct_answer_id FROM questions
+            WHERE lesson_id IS NULL OR lesson_id IN (SELECT id FROM lessons);
+        DROP TABLE questions;
+        ALTER TABLE questions_new RENAME TO questions;
+        CREATE INDEX questions_lesson_id_idx ON questions (lesson_id, id);
+
+        CREATE TABLE answers_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+            answer_text TEXT
+        );
+        INSERT INTO answers_new SELECT id, question_id, answer_text FROM answers
+            WHERE question_id IS NULL OR question_id IN (SELECT id FROM questions);
+        DROP TABLE answers;
+        ALTER TABLE answers_new RENAME TO answers;
+        CREATE INDEX answers_question_id_idx ON answers (question_id, id);
+
+        CREATE TABLE user_attempts_new (
+            user_id INTEGER REFERENCES users(id),
+            question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+            attempts INTEGER DEFAULT 0,
+            is_correct BOOLEAN DEFAULT 0
+        );
+        INSERT INTO user_attempts_new SELECT user_id, question_id, attempts, is_correct FROM user_attempts
+            WHERE question_id IS NULL OR question_id IN (SELECT id FROM questions);
+        DROP TABLE user_attempts;
+        ALTER TABLE user_attempts_new RENAME TO user_attempts;
+        CREATE UNIQUE INDEX user_attempts_user_question_key ON user_attempts (user_id, question_id);
+        CREATE INDEX user_attempts_question_id_idx ON user_attempts (question_id);
+
+        CREATE TABLE user_progress_new (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            is_completed BOOLEAN
+        );
+        INSERT INTO user_progress_new SELECT user_id, lesson_id, is_completed FROM user_progress
+            WHERE lesson_id IS NULL OR lesson_id IN (SELECT id FROM lessons);
+        DROP TABLE user_progress;
+        ALTER TABLE user_progress_new RENAME TO user_progress;
+        CREATE INDEX user_progress_lesson_id_idx ON user_progress (lesson_id);
+
+        CREATE TABLE user_points_new (
+            user_id INTEGER REFERENCES users(id),
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            points INTEGER,
+            badge TEXT
+        );
+        INSERT INTO user_points_new SELECT user_id, lesson_id, points, badge FROM user_points
+            WHERE lesson_id IS NULL OR lesson_id IN (SELECT id FROM lessons);
+        DROP TABLE user_points;
+        ALTER TABLE user_points_new RENAME TO user_points;
+        CREATE INDEX user_points_lesson_id_idx ON user_points (lesson_id);
+
+        CREATE TABLE comments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            username TEXT,
+            text TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO comments_new SELECT id, lesson_id, username, text, timestamp FROM comments
+            WHERE lesson_id IS NULL OR lesson_id IN (SELECT id FROM lessons);
+        DROP TABLE comments;
+        ALTER TABLE comments_new RENAME TO comments;
+        CREATE INDEX comments_lesson_timestamp_idx ON comments (lesson_id, timestamp DESC, id DESC);
+
+        DELETE FROM sqlite_sequence WHERE name IN (SELECT name FROM saved_sequences);
+        INSERT INTO sqlite_sequence (name, seq) SELECT name, seq FROM saved_sequences;
+        DROP TABLE saved_sequences;
+    """),
+
+    (6, "content versions for catalog ETags", MIGRATIONS[5][2]),
+
+    (7, "incremental progress rollups", """
+        ALTER TABLE lessons ADD COLUMN question_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE courses ADD COLUMN question_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE courses ADD COLUMN quiz_lesson_count INTEGER NOT NULL DEFAULT 0;
+
+        UPDATE lessons SET question_count = (SELECT COUNT(*) FROM questions q WHERE q.lesson_id = lessons.id);
+        UPDATE courses SET
+            question_count = (SELECT COALESCE(SUM(l.question_count), 0) FROM lessons l WHERE l.course_id = courses.id),
+            quiz_lesson_count = (SELECT COUNT(*) FROM lessons l WHERE l.course_id = courses.id AND l.question_count > 0);
+
+        CREATE TRIGGER questions_counts_insert
+        AFTER INSERT ON questions
+        BEGIN
+            UPDATE lessons SET question_count = question_count + 1 WHERE id = NEW.lesson_id;
+            UPDATE courses SET
+                question_count = question_count + 1,
+                quiz_lesson_count = quiz_lesson_count + (SELECT question_count = 1 FROM lessons WHERE id = NEW.lesson_id)
+            WHERE id = (SELECT course_id FROM lessons WHERE id = NEW.lesson_id);
+        END;
+
+        CREATE TRIGGER questions_counts_delete
+        AFTER DELETE ON questions
+        BEGIN
+            UPDATE lessons SET question_count = question_count - 1 WHERE id = OLD.lesson_id;
+            UPDATE courses SET
+                question_count = question_count - 1,
+                quiz_lesson_count = quiz_lesson_count - (SELECT question_count = 0 FROM lessons WHERE id = OLD.lesson_id)
+            WHERE id = (SELECT course_id FROM lessons WHERE id = OLD.lesson_id);
+        END;
+
+        CREATE TRIGGER lessons_counts_delete
+        AFTER DELETE ON lessons
+        BEGIN
+            UPDATE courses SET
+                question_count = question_count - OLD.question_count,
+                quiz_lesson_count = quiz_lesson_count - (OLD.question_count > 0)
+            WHERE id = OLD.course_id;
+        END;
+
+        -- Refilled by progress.backfill() after this commits (see migrate())
+        DELETE FROM user_progress;
+        DELETE FROM user_points;
+        ALTER TABLE user_progress ADD COLUMN questions_correct INTEGER NOT NULL DEFAULT 0;
+        CREATE UNIQUE INDEX user_progress_user_lesson_key ON user_progress (user_id, lesson_id);
+        CREATE UNIQUE INDEX user_points_user_lesson_key ON user_points (user_id, lesson_id);
+
+        CREATE TABLE IF NOT EXISTS course_progress (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+            lessons_completed INTEGER NOT NULL DEFAULT 0,
+            questions_correct INTEGER NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0,
+            badge TEXT,
+            PRIMARY KEY (user_id, course_id)
+        );
+        CREATE INDEX IF NOT EXISTS course_progress_course_id_idx ON course_progress (course_id);
+        -- record_progress() lives in grading.py on SQLite
+    """),
+
+    (8, "points ledger and windowed leaderboards", """
+        -- SQLite has no partitioning; `python leaderboards.py maintain`
+        -- deletes ledger rows past their retention instead.
+        CREATE TABLE IF NOT EXISTS points_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            question_id INTEGER,
+            course_id INTEGER,
+            points INTEGER NOT NULL,
+            awarded_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS points_ledger_awarded_at_idx ON points_ledger (awarded_at);
+        CREATE INDEX IF NOT EXISTS points_ledger_user_idx ON points_ledger (user_id, awarded_at);
+
+        CREATE TABLE IF NOT EXISTS leaderboard_windows (
+            period TEXT NOT NULL,
+            bucket_start DATE NOT NULL,
+            course_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, course_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS leaderboard_windows_rank_idx
+            ON leaderboard_windows (period, bucket_start, course_id, points DESC, user_id);
+
+        CREATE INDEX IF NOT EXISTS course_progress_points_idx ON course_progress (course_id, points DESC, user_id);
+        DROP INDEX IF EXISTS course_progress_course_id_idx;
+        -- record_points() lives in grading.py on SQLite
+    """),
+
+    (9, "whole-quiz grading", """
+        -- grade_attempt() and grade_quiz() live in grading.py on SQLite
+        SELECT 1;
+    """),
+
+    (10, "sharded score histogram", """
+        -- SQLite has a single writer, so there is no row contention to spread
+        SELECT 1;
+    """),
+
+    (11, "cascade user deletes", """
+        -- Rebuilt as in migration 5; rows of users already gone are dropped
+        CREATE TABLE user_attempts_new (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+            attempts INTEGER DEFAULT 0,
+            is_correct BOOLEAN DEFAULT 0
+        );
+        INSERT INTO user_attempts_new SELECT user_id, question_id, attempts, is_correct FROM user_attempts
+            WHERE user_id IS NULL OR user_id IN (SELECT id FROM users);
+        DROP TABLE user_attempts;
+        ALTER TABLE user_attempts_new RENAME TO user_attempts;
+        CREATE UNIQUE INDEX user_attempts_user_question_key ON user_attempts (user_id, question_id);
+        CREATE INDEX user_attempts_question_id_idx ON user_attempts (question_id);
+
+        CREATE TABLE user_progress_new (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            is_completed BOOLEAN,
+            questions_correct INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT INTO user_progress_new SELECT user_id, lesson_id, is_completed, questions_correct FROM user_progress
+            WHERE user_id IS NULL OR user_id IN (SELECT id FROM users);
+        DROP TABLE user_progress;
+        ALTER TABLE user_progress_new RENAME TO user_progress;
+        CREATE INDEX user_progress_lesson_id_idx ON user_progress (lesson_id);
+        CREATE UNIQUE INDEX user_progress_user_lesson_key ON user_progress (user_id, lesson_id);
+
+        CREATE TABLE user_points_new (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            lesson_id INTEGER REFERENCES lessons(id) ON DELETE CASCADE,
+            points INTEGER,
+            badge TEXT
+        );
+        INSERT INTO user_points_new SELECT user_id, lesson_id, points, badge FROM user_points
+            WHERE user_id IS NULL OR user_id IN (SELECT id FROM users);
+        DROP TABLE user_points;
+        ALTER TABLE user_points_new RENAME TO user_points;
+        CREATE INDEX user_points_lesson_id_idx ON user_points (lesson_id);
+        CREATE UNIQUE INDEX user_points_user_lesson_key ON user_points (user_id, lesson_id);
+    """),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Arbitrary key so concurrent `migrate` runs (e.g. two deploys) serialize
+MIGRATION_LOCK_ID = 7212001
+
+# Emptied user_progress / user_points, which migrate() then refills
+ROLLUPS_VERSION = 7
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def current_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        version = cursor.fetchone()[0] or 0
+    except UndefinedTable:
+        version = 0
+    conn.rollback()
+    cursor.close()
+    return version
+
+
+def check_schema():
+    # Startup check: one SELECT, no DDL
+    with connection() as conn:
+        version = current_version(conn)
+    if version < SCHEMA_VERSION:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, code expects {SCHEMA_VERSION}. "
+            "Run `python migrations.py` first."
+        )
+    return version
+
+
+def migrate(target=SCHEMA_VERSION):
+    sqlite = DIALECT == "sqlite"
+    applied = []
+    with connection() as conn:
+        cursor = conn.cursor()
+        if sqlite:
+            # Table rebuilds must not trip (or cascade through) foreign keys;
+            # the pragma only takes effect outside a transaction.
+            cursor.execute("PRAGMA foreign_keys = OFF")
+        else:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+            cursor.execute("SELECT version FROM schema_migrations")
+            done = {row[0] for row in cursor.fetchall()}
+
+            for version, name, ddl in SQLITE_MIGRATIONS if sqlite else MIGRATIONS:
+                if version in done or version > target:
+                    continue
+                if sqlite:
+                    # executescript runs many statements; the open BEGIN keeps
+                    # them in one transaction with the version row below.
+                    conn.executescript("BEGIN IMMEDIATE;\n" + ddl)
+                else:
+                    cursor.execute(ddl)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+                applied.append((version, name))
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if sqlite:
+                cursor.execute("PRAGMA foreign_keys = ON")
+            else:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+            cursor.close()
+
+    if any(version == ROLLUPS_VERSION for version, _ in applied):
+        # Migration 7 emptied the per-lesson rollups; rebuild them now, in
+        # the backfill's own chunked transactions, so progress is not blank
+        # after a release.
+        from progress import backfill
+        backfill()
+    return applied
+
+
+def main(argv):
+    command = argv[0] if argv else "migrate"
+
+    if command == "status":
+        with connection() as conn:
+            version = current_version(conn)
+        print(f"schema version {version} (latest {SCHEMA_VERSION})")
+        return 0 if version >= SCHEMA_VERSION else 1
+
+    if command == "migrate":
+        applied = migrate()
+        for version, name in applied:
+            print(f"applied {version:04d} {name}")
+        if not applied:
+            print(f"schema already at version {SCHEMA_VERSION}")
+        return 0
+
+    print(f"unknown command: {command} (expected migrate or status)", file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,86 @@
+# backend/pagination.py
+#
+# Keyset (cursor) pagination for the list endpoints. Response bodies stay
+# plain JSON arrays; the cursor for the next page travels in headers:
+#
+#     X-Next-Cursor: <token>
+#     Link: </comments/7?limit=100&after=<token>>; rel="next"
+#
+# A cursor is the sort key of the last row served, so every page is an index
+# range scan no matter how deep the client goes.
+
+import base64
+import datetime
+import json
+import os
+from urllib.parse import urlencode
+
+from flask import jsonify, request
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def timestamp(value):
+    # Cursor field type for timestamp sort keys
+    return value if value in ("infinity", "-infinity") else datetime.datetime.fromisoformat(value)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, types):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(cast(value) for cast, value in zip(types, values))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid pagination cursor")
+
+
+def page_args(types=(int,), start=(0,)):
+    # Returns (limit, after). `after` falls back to `start`, a key that sorts
+    # before every real row, so queries never need a separate first-page form.
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    token = request.args.get('after')
+    after = decode_cursor(token, types) if token else tuple(start)
+    return limit, after
+
+
+def paginate(rows, limit, key):
+    # Queries fetch limit + 1 rows; the extra one only signals another page.
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def page_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def init_app(app):
+    @app.errorhandler(InvalidCursor)
+    def invalid_cursor(error):
+        return {"error": str(error)}, 400
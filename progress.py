@@ -0,0 +1,156 @@
+# backend/progress.py
+#
+# Per-user progress rollups, updated by grade_answer on every correct answer
+# (record_progress() from migration 7, or grading.record_progress on SQLite):
+#
+#     user_progress    (user, lesson)  questions answered correctly, completed?
+#     user_points      (user, lesson)  points earned there and the lesson badge
+#     course_progress  (user, course)  lessons completed, questions, points, badge
+#
+# Percentages divide by lessons.question_count and courses.question_count /
+# quiz_lesson_count, which triggers on questions and lessons keep current.
+# Deleting content does not take points back (users.total_points never did
+# either), so rollups can lag content edits until the next backfill:
+#
+#     python progress.py backfill              # every user, in chunks
+#     python progress.py backfill --users 1-5000
+
+import argparse
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import DIALECT, connection
+from grading import BADGES, POINTS_BY_ATTEMPT
+
+BACKFILL_CHUNK = 5000  # users per transaction
+
+
+def percent(done, total):
+    return round(100.0 * min(done, total) / total, 1) if total else 0.0
+
+
+def _badge_sql(points, correct, questions):
+    cases = " ".join(f"WHEN {points} >= {per_question} * {questions} THEN '{name}'"
+                     for name, per_question in BADGES)
+    return f"CASE WHEN {questions} = 0 OR {correct} < {questions} THEN NULL {cases} END"
+
+
+# ----------------------------------------
+# Backfill
+# ----------------------------------------
+_POINTS_SQL = ("CASE " + " ".join(f"WHEN ua.attempts = {n} THEN {p}" for n, p in POINTS_BY_ATTEMPT.items())
+               + " ELSE 0 END")
+
+RECOUNT_CONTENT = [
+    "UPDATE lessons SET question_count = (SELECT COUNT(*) FROM questions q WHERE q.lesson_id = lessons.id)",
+    """UPDATE courses SET
+        question_count = (SELECT COALESCE(SUM(l.question_count), 0) FROM lessons l WHERE l.course_id = courses.id),
+        quiz_lesson_count = (SELECT COUNT(*) FROM lessons l WHERE l.course_id = courses.id AND l.question_count > 0)""",
+]
+
+# Each runs for one user id range, %(first)s to %(last)s
+REBUILD_USERS = [
+    "DELETE FROM course_progress WHERE user_id BETWEEN %(first)s AND %(last)s",
+    "DELETE FROM user_points WHERE user_id BETWEEN %(first)s AND %(last)s",
+    "DELETE FROM user_progress WHERE user_id BETWEEN %(first)s AND %(last)s",
+    """
+    INSERT INTO user_progress (user_id, lesson_id, questions_correct, is_completed)
+    SELECT ua.user_id, q.lesson_id, COUNT(*), COUNT(*) >= MAX(l.question_count)
+    FROM user_attempts ua
+    JOIN questions q ON q.id = ua.question_id
+    JOIN lessons l ON l.id = q.lesson_id
+    WHERE ua.is_correct AND ua.user_id BETWEEN %(first)s AND %(last)s
+    GROUP BY ua.user_id, q.lesson_id
+    """,
+    """
+    INSERT INTO user_points (user_id, lesson_id, points, badge)
+    SELECT s.user_id, s.lesson_id, s.points, """ + _badge_sql("s.points", "s.correct", "l.question_count") + """
+    FROM (
+        SELECT ua.user_id, q.lesson_id, COUNT(*) AS correct, SUM(""" + _POINTS_SQL + """) AS points
+        FROM user_attempts ua
+        JOIN questions q ON q.id = ua.question_id
+        WHERE ua.is_correct AND ua.user_id BETWEEN %(first)s AND %(last)s
+        GROUP BY ua.user_id, q.lesson_id
+    ) s
+    JOIN lessons l ON l.id = s.lesson_id
+    """,
+    """
+    INSERT INTO course_progress (user_id, course_id, lessons_completed, questions_correct, points, badge)
+    SELECT s.user_id, s.course_id, s.completed, s.correct, s.points,
+           """ + _badge_sql("s.points", "s.correct", "c.question_count") + """
+    FROM (
+        SELECT up.user_id, l.course_id,
+               SUM(CASE WHEN up.is_completed THEN 1 ELSE 0 END) AS completed,
+               SUM(up.questions_correct) AS correct, SUM(pt.points) AS points
+        FROM user_progress up
+        JOIN user_points pt ON pt.user_id = up.user_id AND pt.lesson_id = up.lesson_id
+        JOIN lessons l ON l.id = up.lesson_id
+        WHERE up.user_id BETWEEN %(first)s AND %(last)s AND l.course_id IS NOT NULL
+        GROUP BY up.user_id, l.course_id
+    ) s
+    JOIN courses c ON c.id = s.course_id
+    """,
+]
+
+
+def recount_content(cursor):
+    for statement in RECOUNT_CONTENT:
+        cursor.execute(statement)
+
+
+def backfill(first=None, last=None, chunk=BACKFILL_CHUNK, log=None):
+    # Rebuilds the rollups from user_attempts, one committed transaction per
+    # chunk of user ids so live grading is only ever blocked briefly.
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            recount_content(cursor)
+            conn.commit()
+            cursor.execute("SELECT MIN(id), MAX(id) FROM users")
+            low, high = cursor.fetchone()
+            conn.commit()
+            if low is None:
+                return 0
+            first = low if first is None else max(first, low)
+            last = high if last is None else min(last, high)
+
+            users = 0
+            for start in range(first, last + 1, chunk):
+                params = {"first": start, "last": min(start + chunk - 1, last)}
+                for statement in REBUILD_USERS:
+                    cursor.execute(statement, params)
+                cursor.execute("SELECT COUNT(*) FROM users WHERE id BETWEEN %(first)s AND %(last)s", params)
+                users += cursor.fetchone()[0]
+                conn.commit()
+                if log:
+                    log(f"  users {params['first']}-{params['last']} rebuilt")
+            return users
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="progress.py")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--users", help="user id range to rebuild, e.g. 1-5000 (default: all)")
+    parser.add_argument("--chunk", type=int, default=BACKFILL_CHUNK, help="users per transaction")
+    args = parser.parse_args(argv)
+
+    first = last = None
+    if args.users:
+        first, _, last = args.users.partition("-")
+        first, last = int(first), int(last or first)
+
+    users = backfill(first, last, args.chunk, log=print)
+    print(f"rebuilt progress rollups for {users} users ({DIALECT})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
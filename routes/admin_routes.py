@@ -0,0 +1,98 @@
+# backend/routes/admin_routes.py
+
+import csv
+import io
+import json
+
+from flask import Blueprint, request, jsonify, Response
+from db import connection
+from tokens import require_auth
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+# Rows are pulled from a server-side cursor this many at a time and written
+# out as one chunk, so memory stays flat however large the table is.
+EXPORT_BATCH_SIZE = 2000
+
+EXPORTS = {
+    "attempts": (
+        ["username", "question_id", "lesson_id", "lesson_title", "attempts", "is_correct"],
+        """
+        SELECT u.username, ua.question_id, l.id, l.title, ua.attempts, ua.is_correct
+        FROM user_attempts ua
+        JOIN users u ON u.id = ua.user_id
+        JOIN questions q ON q.id = ua.question_id
+        JOIN lessons l ON l.id = q.lesson_id
+        """,
+    ),
+    "points": (
+        ["username", "lesson_id", "lesson_title", "points", "badge"],
+        """
+        SELECT u.username, up.lesson_id, l.title, up.points, up.badge
+        FROM user_points up
+        JOIN users u ON u.id = up.user_id
+        LEFT JOIN lessons l ON l.id = up.lesson_id
+        """,
+    ),
+    "comments": (
+        ["id", "username", "lesson_id", "lesson_title", "text", "timestamp"],
+        """
+        SELECT c.id, c.username, c.lesson_id, l.title, c.text, c.timestamp
+        FROM comments c
+        LEFT JOIN lessons l ON l.id = c.lesson_id
+        """,
+    ),
+}
+
+
+# ----------------------------------------
+# ✅ Stream a dataset as NDJSON or CSV (admin only)
+# GET /admin/export/<attempts|points|comments>?format=ndjson|csv
+# ----------------------------------------
+@admin_bp.route('/export/<dataset>', methods=['GET'])
+@require_auth(role="admin")
+def export(dataset):
+    fmt = request.args.get('format', 'ndjson')
+
+    if dataset not in EXPORTS:
+        return jsonify({"error": f"Unknown dataset. Choose one of: {', '.join(EXPORTS)}"}), 404
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    columns, sql = EXPORTS[dataset]
+    encode = _ndjson_chunk if fmt == 'ndjson' else _csv_chunk
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+
+    def generate():
+        if fmt == 'csv':
+            yield _csv_chunk(columns, [columns])
+        # Uses its own pooled connection: the request's connection is
+        # returned as soon as the response starts streaming.
+        with connection() as export_conn:
+            with export_conn.cursor(name=f"export_{dataset}") as rows:
+                rows.itersize = EXPORT_BATCH_SIZE
+                rows.execute(sql)
+                while True:
+                    batch = rows.fetchmany(EXPORT_BATCH_SIZE)
+                    if not batch:
+                        break
+                    yield encode(columns, batch)
+
+    return Response(generate(), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={dataset}.{fmt}",
+        "X-Accel-Buffering": "no",
+    })
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _ndjson_chunk(columns, batch):
+    return "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in batch)
+
+
+def _csv_chunk(columns, batch):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    return buffer.getvalue()
@@ -1,11 +1,20 @@
 # backend/routes/auth_routes.py
 
+import datetime
+
 from flask import Blueprint, request, jsonify
-import psycopg2
-from models import get_db
+from db import get_db, UniqueViolation
+from pagination import page_args, paginate, page_response
+from users import forget, lookup_user, user_cache
+from live import invalidate
+from tokens import TOKEN_TTL, current_user, issue_token, require_auth, revoke_token, revoke_user
+import leaderboards
 
 auth_bp = Blueprint('auth', __name__)
 
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 100
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -23,12 +32,11 @@ def register():
         """, (username, password, role))
         conn.commit()
         return jsonify({"message": "User registered successfully!"}), 201
-    except psycopg2.errors.UniqueViolation:
+    except UniqueViolation:
         conn.rollback()
         return jsonify({"error": "Username already exists"}), 409
     finally:
         cursor.close()
-        conn.close()
 
 
 @auth_bp.route('/login', methods=['POST'])
@@ -39,42 +47,61 @@ def login():
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT password FROM users WHERE username=%s", (username,))
+    cursor.execute("SELECT id, password, role FROM users WHERE username=%s", (username,))
     row = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if not row:
         return jsonify({"error": "❌ Username does not exist."}), 404
 
-    if row[0] != password:
+    user_id, stored_password, role = row
+    if stored_password != password:
         return jsonify({"error": "❌ Incorrect password."}), 401
 
-    return jsonify({"message": "Login successful!"}), 200
+    return jsonify({
+        "message": "Login successful!",
+        "token": issue_token(user_id, username, role),
+        "role": role,
+        "expires_in": TOKEN_TTL,
+    }), 200
+
+
+@auth_bp.route('/logout', methods=['POST'])
+@require_auth()
+def logout():
+    revoke_token(current_user())
+    return jsonify({"message": "Logged out"}), 200
 
 
 @auth_bp.route('/all-users', methods=['GET'])
 def all_users():
+    limit, after = page_args()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT username, role, total_points FROM users")
-    users = cursor.fetchall()
+    cursor.execute(
+        "SELECT id, username, role, total_points FROM users WHERE id > %s ORDER BY id LIMIT %s",
+        (after[0], limit + 1)
+    )
+    users, next_cursor = paginate(cursor.fetchall(), limit, key=lambda u: (u[0],))
     cursor.close()
-    conn.close()
-    return jsonify([{"username": u[0], "role": u[1], "total_points": u[2] or 0} for u in users])
+    return page_response([{"username": u[1], "role": u[2], "total_points": u[3] or 0} for u in users], next_cursor)
 
 
 @auth_bp.route('/role/<username>', methods=['GET'])
 def get_user_role(username):
+    # A caller asking about themselves is answered from their token's claims
+    claims = current_user()
+    if claims and claims["sub"] == username:
+        return jsonify({"role": claims["role"]})
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT role FROM users WHERE username = %s", (username,))
-    row = cursor.fetchone()
+    user = lookup_user(cursor, username)
     cursor.close()
-    conn.close()
 
-    if row:
-        return jsonify({"role": row[0]})
+    if user:
+        return jsonify({"role": user[1]})
     return jsonify({"error": "User not found"}), 404
 
 
@@ -85,31 +112,33 @@ def get_user_points(username):
     cursor.execute("SELECT total_points FROM users WHERE username = %s", (username,))
     row = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     return jsonify({"total_points": row[0] if row else 0})
 
 
 @auth_bp.route('/user-attempts/<username>')
 def get_user_attempts(username):
+    limit, after = page_args()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-    user = cursor.fetchone()
+    user = lookup_user(cursor, username)
 
     if not user:
         cursor.close()
-        conn.close()
         return jsonify([])
 
     user_id = user[0]
-    cursor.execute("SELECT question_id, attempts, is_correct FROM user_attempts WHERE user_id = %s", (user_id,))
-    rows = cursor.fetchall()
+    cursor.execute("""
+        SELECT question_id, attempts, is_correct FROM user_attempts
+        WHERE user_id = %s AND question_id > %s
+        ORDER BY question_id LIMIT %s
+    """, (user_id, after[0], limit + 1))
+    rows, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[0],))
     cursor.close()
-    conn.close()
 
     result = [{"question_id": row[0], "attempts": row[1], "is_correct": bool(row[2])} for row in rows]
-    return jsonify(result)
+    return page_response(result, next_cursor)
 
 
 @auth_bp.route('/user/<username>', methods=['GET'])
@@ -119,7 +148,6 @@ def get_user_profile(username):
     cursor.execute("SELECT username, full_name FROM users WHERE username = %s", (username,))
     row = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if row:
         return jsonify({"username": row[0], "full_name": row[1] or ""})
@@ -136,26 +164,31 @@ def update_profile():
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id FROM users WHERE username = %s", (current_username,))
-    if not cursor.fetchone():
+    user = lookup_user(cursor, current_username)
+    if not user:
         cursor.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
 
-    if new_username and new_username != current_username:
-        cursor.execute("SELECT id FROM users WHERE username = %s", (new_username,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "New username is already taken"}), 409
-
-    cursor.execute("""
-        UPDATE users SET username = %s, full_name = %s WHERE username = %s
-    """, (new_username or current_username, full_name, current_username))
+    # The unique index on username decides whether the new name is free;
+    # matching on id and name guards against a stale cache entry.
+    try:
+        cursor.execute("""
+            UPDATE users SET username = %s, full_name = %s WHERE id = %s AND username = %s
+            RETURNING id
+        """, (new_username or current_username, full_name, user[0], current_username))
+        updated = cursor.fetchone()
+        invalidate(cursor, "user", *{current_username, new_username or current_username})
+    except UniqueViolation:
+        conn.rollback()
+        cursor.close()
+        return jsonify({"error": "New username is already taken"}), 409
 
     conn.commit()
     cursor.close()
-    conn.close()
+    forget(current_username, new_username)
+
+    if not updated:
+        return jsonify({"error": "User not found"}), 404
     return jsonify({"message": "Profile updated!"}), 200
 
 
@@ -174,77 +207,142 @@ def change_password():
 
     if not row:
         cursor.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
 
     if row[0] != old_password:
         cursor.close()
-        conn.close()
         return jsonify({"error": "Old password is incorrect"}), 403
 
     cursor.execute("UPDATE users SET password = %s WHERE username = %s", (new_password, username))
     conn.commit()
     cursor.close()
-    conn.close()
 
     return jsonify({"message": "Password changed successfully!"}), 200
 
 
 @auth_bp.route('/debug/users')
 def debug_users():
+    limit, after = page_args()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
+    cursor.execute("SELECT * FROM users WHERE id > %s ORDER BY id LIMIT %s", (after[0], limit + 1))
+    users, next_cursor = paginate(cursor.fetchall(), limit, key=lambda u: (u[0],))
     cursor.close()
-    conn.close()
-    return jsonify(users)
+    return page_response(users, next_cursor)
+
+
+@auth_bp.route('/debug/user-cache')
+def debug_user_cache():
+    return jsonify(user_cache.stats())
+
+
+def _board_args():
+    # ?window=all|week|month&course_id=<id>&bucket=<any YYYY-MM-DD in the window>
+    window = request.args.get('window', 'all')
+    course_id = request.args.get('course_id', type=int)
+    bucket = request.args.get('bucket')
+    if window != 'all' and window not in leaderboards.WINDOWS:
+        raise leaderboards.InvalidBoard("window must be all, week or month")
+    if bucket is not None:
+        try:
+            bucket = datetime.date.fromisoformat(bucket)
+        except ValueError:
+            raise leaderboards.InvalidBoard("bucket must be a YYYY-MM-DD date")
+    return window, course_id, bucket
+
+
+@auth_bp.errorhandler(leaderboards.InvalidBoard)
+def invalid_board(error):
+    return jsonify({"error": str(error)}), 400
 
 
 @auth_bp.route('/leaderboard', methods=['GET'])
 def leaderboard():
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    window, course_id, bucket = _board_args()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT username, total_points FROM users ORDER BY total_points DESC")
+    if window != 'all' or course_id is not None:
+        # Weekly / monthly buckets or a course's board (see leaderboards.py)
+        rows = leaderboards.board(cursor, window, course_id, bucket, limit, offset)
+        cursor.close()
+        return jsonify([{"username": row[0], "points": row[1], "rank": row[2]} for row in rows])
+
+    # Top-N walks users_total_points_idx; ranks come from the score histogram
+    cursor.execute("""
+        WITH page AS (
+            SELECT id, username, total_points FROM users
+            ORDER BY total_points DESC, id
+            LIMIT %s OFFSET %s
+        ), ranks AS (
+            SELECT total_points,
+                   SUM(SUM(user_count)::INTEGER) OVER (ORDER BY total_points DESC) - SUM(user_count) + 1 AS rank
+            FROM leaderboard_scores
+            WHERE total_points >= (SELECT MIN(total_points) FROM page)
+            GROUP BY total_points
+        )
+        SELECT p.username, p.total_points, r.rank
+        FROM page p JOIN ranks r USING (total_points)
+        ORDER BY p.total_points DESC, p.id
+    """, (limit, offset))
     rows = cursor.fetchall()
     cursor.close()
-    conn.close()
 
-    return jsonify([{"username": row[0], "total_points": row[1] or 0} for row in rows])
+    return jsonify([{"username": row[0], "total_points": row[1], "rank": row[2]} for row in rows])
 
 
-@auth_bp.route('/delete-user/<target_username>', methods=['DELETE'])
-def delete_user(target_username):
-    data = request.get_json()
-    requesting_username = data.get("requesting_username")
-
-    if not requesting_username:
-        return jsonify({"error": "Requesting user not provided"}), 400
+@auth_bp.route('/leaderboard/rank/<username>', methods=['GET'])
+def leaderboard_rank(username):
+    window, course_id, bucket = _board_args()
 
     conn = get_db()
     cursor = conn.cursor()
+    if window != 'all' or course_id is not None:
+        user = lookup_user(cursor, username)
+        if not user:
+            cursor.close()
+            return jsonify({"error": "User not found"}), 404
+        points, rank = leaderboards.rank(cursor, user[0], window, course_id, bucket)
+        cursor.close()
+        return jsonify({"username": username, "points": points, "rank": rank})
 
-    cursor.execute("SELECT role FROM users WHERE username = %s", (requesting_username,))
+    cursor.execute("""
+        SELECT u.username, u.total_points,
+               1 + (SELECT COALESCE(SUM(s.user_count), 0) FROM leaderboard_scores s
+                    WHERE s.total_points > u.total_points)
+        FROM users u WHERE u.username = %s
+    """, (username,))
     row = cursor.fetchone()
+    cursor.close()
 
     if not row:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Requesting user not found"}), 404
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"username": row[0], "total_points": row[1], "rank": row[2]})
 
-    if row[0] != "admin":
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Only admins can delete users"}), 403
 
-    if requesting_username == target_username:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "You cannot delete yourself"}), 403
+@auth_bp.route('/delete-user/<target_username>', methods=['DELETE'])
+@require_auth(role="admin")
+def delete_user(target_username):
+    conn = get_db()
+    cursor = conn.cursor()
 
-    cursor.execute("DELETE FROM users WHERE username = %s", (target_username,))
+    # Attempts, progress rollups, the ledger and leaderboards cascade
+    cursor.execute("DELETE FROM users WHERE username = %s AND id <> %s RETURNING id",
+                   (target_username, current_user()["uid"]))
+    row = cursor.fetchone()
+    if row is not None:
+        invalidate(cursor, "user", target_username)
     conn.commit()
     cursor.close()
-    conn.close()
+
+    if row is None and target_username == current_user()["sub"]:
+        return jsonify({"error": "You cannot delete yourself"}), 403
+    if row is not None:
+        revoke_user(row[0])
+        forget(target_username)
 
     return jsonify({"message": f"User '{target_username}' has been deleted."}), 200
@@ -1,40 +1,14 @@
 # backend/routes/comment_routes.py
 
-from flask import Blueprint, request, jsonify
-import psycopg2
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from flask import Blueprint, Response, request, jsonify
+from db import get_db
+from pagination import page_args, paginate, page_response, timestamp
+from live import STREAMS_ENABLED, TooManySubscribers, broker, event_stream, publish_comment
+import comment_writer
 
 # Set prefix here so endpoints become: /comments/...
 comment_bp = Blueprint('comments', __name__, url_prefix='/comments')
 
-def get_db():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("DB_PORT")
-    )
-
-# 🔧 Create Comments Table
-def create_comment_table():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS comments (
-            id SERIAL PRIMARY KEY,
-            lesson_id INTEGER,
-            username TEXT,
-            text TEXT,
-            timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
 
 # 📥 POST a Comment - POST /comments
 @comment_bp.route('', methods=['POST'])
@@ -47,33 +21,73 @@ def post_comment():
     if not lesson_id or not username or not text:
         return jsonify({"error": "Missing lesson_id, username, or text"}), 400
 
+    if comment_writer.BATCHED:
+        # Group commit: returns once the batch holding this comment commits
+        try:
+            comment_writer.writer.submit(lesson_id, username, text)
+            return jsonify({"message": "Comment added successfully"}), 201
+        except TimeoutError:
+            # Withdrawn from the queue before it was written, so a retry is safe
+            return jsonify({"error": "Server is busy, please try again."}), 503
+        except comment_writer.StillPending:
+            return jsonify({"message": "Comment queued"}), 202
+        except comment_writer.WriterClosed:
+            pass  # worker is shutting down; write it directly
+
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO comments (lesson_id, username, text) VALUES (%s, %s, %s)",
+        "INSERT INTO comments (lesson_id, username, text) VALUES (%s, %s, %s) RETURNING id, timestamp",
         (lesson_id, username, text)
     )
+    comment_id, posted = cursor.fetchone()
+    publish_comment(cursor, comment_id, lesson_id, username, text, posted)
     conn.commit()
-    conn.close()
 
     return jsonify({"message": "Comment added successfully"}), 201
 
 # 📤 GET Comments for a Lesson - GET /comments/<lesson_id>
 @comment_bp.route('/<int:lesson_id>', methods=['GET'])
 def get_comments(lesson_id):
+    # Newest first; the cursor is (timestamp, id) of the last comment served
+    limit, after = page_args(types=(timestamp, int), start=("infinity", 0))
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT username, text, timestamp FROM comments WHERE lesson_id = %s ORDER BY timestamp DESC",
-        (lesson_id,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    cursor.execute("""
+        SELECT id, username, text, timestamp FROM comments
+        WHERE lesson_id = %s AND (timestamp, id) < (%s::timestamptz, %s)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s
+    """, (lesson_id, after[0], after[1], limit + 1))
+    rows, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[3], row[0]))
 
     comments = [{
-        "username": row[0],
-        "text": row[1],
-        "timestamp": row[2]
+        "username": row[1],
+        "text": row[2],
+        "timestamp": row[3]
     } for row in rows]
 
-    return jsonify(comments)
+    return page_response(comments, next_cursor)
+
+# 📡 Live comments for a Lesson (Server-Sent Events) - GET /comments/<lesson_id>/stream
+@comment_bp.route('/<int:lesson_id>/stream', methods=['GET'])
+def stream_comments(lesson_id):
+    # EventSource resends the last id it saw when it reconnects
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', type=int)
+
+    if not STREAMS_ENABLED:
+        # Sync workers serve one request at a time (see live.py)
+        return jsonify({"error": "Live comments are unavailable, please poll /comments instead."}), 503
+
+    try:
+        subscription = broker.subscribe(lesson_id)
+    except TooManySubscribers:
+        return jsonify({"error": "Too many live viewers, please poll /comments instead."}), 503
+
+    return Response(event_stream(lesson_id, subscription, last_id), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
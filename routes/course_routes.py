@@ -1,27 +1,44 @@
 # backend/routes/course_routes.py
 
-from flask import Blueprint, request, jsonify
-import psycopg2
+import logging
 import os
+import threading
+import time
+
+from flask import Blueprint, request, jsonify
+from db import DIALECT, get_db, connection, insert_rows
+from pagination import page_args, paginate, page_response
+from http_cache import bump_version, conditional
+from live import invalidate
+from sqlite_db import reserve_ids
+from tokens import require_auth
+from routes.quiz_routes import quiz_cache
 
 course_bp = Blueprint('course', __name__)
+log = logging.getLogger(__name__)
+
+# Columns clients may request with ?fields=, and what they get by default.
+# Lesson listings leave out lesson_text; GET /lessons/<id> has the full body.
+COURSE_FIELDS = ["id", "title", "description", "language"]
+LESSON_FIELDS = ["id", "course_id", "title", "video_url", "lesson_text"]
+LESSON_LIST_DEFAULT_FIELDS = ["id", "title", "video_url"]
+
+# Background course deletes remove at most this many rows per transaction
+DELETE_CHUNK_SIZE = int(os.getenv("COURSE_DELETE_CHUNK_SIZE", "1000"))
+DELETE_CHUNK_PAUSE = float(os.getenv("COURSE_DELETE_CHUNK_PAUSE", "0.05"))
+DELETE_MAX_RUNNING = int(os.getenv("COURSE_DELETE_MAX_RUNNING", "2"))  # background deletes per worker
+
+_deleting_lock = threading.Lock()
+_deleting = set()  # course ids with a background delete running in this worker
 
-def get_db():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("DB_PORT", 5432)
-    )
 
 # ----------------------------------------
 # ✅ Add a new course (admin only)
 # ----------------------------------------
 @course_bp.route('/courses', methods=['POST'])
+@require_auth(role="admin")
 def add_course():
     data = request.get_json()
-    username = data.get('username')
     title = data.get('title')
     description = data.get('description')
     language = data.get('language', 'General')
@@ -29,45 +46,151 @@ def add_course():
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT role FROM users WHERE username = %s", (username,))
-    user = cursor.fetchone()
-
-    if not user or user[0] != 'admin':
-        return jsonify({"error": "Only admins can add courses."}), 403
-
     cursor.execute(
         "INSERT INTO courses (title, description, language) VALUES (%s, %s, %s)",
         (title, description, language)
     )
+    bump_version(cursor, "catalog")
     conn.commit()
-    conn.close()
 
     return jsonify({"message": "Course added successfully"}), 201
 
+# ----------------------------------------
+# ✅ Import a whole course tree in one request (admin only)
+# ----------------------------------------
+# Body: {"title", "description", "language",
+#        "lessons": [{"title", "video_url", "lesson_text",
+#                     "questions": [{"question_text",
+#                                    "answers": [{"text", "is_correct"}]}]}]}
+@course_bp.route('/courses/import', methods=['POST'])
+@require_auth(role="admin")
+def import_course():
+    data = request.get_json(silent=True)
+
+    error = _validate_course_tree(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    lessons = data.get('lessons', [])
+    questions = [q for lesson in lessons for q in lesson.get('questions', [])]
+    answers = [a for q in questions for a in q.get('answers', [])]
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Reserve every id up front so parents and children (and each question's
+    # correct_answer_id) can be written with one multi-row INSERT per table.
+    if DIALECT == "sqlite":
+        course_id = reserve_ids(cursor, "courses", 1)[0]
+        lesson_ids = reserve_ids(cursor, "lessons", len(lessons))
+        question_ids = reserve_ids(cursor, "questions", len(questions))
+        answer_ids = reserve_ids(cursor, "answers", len(answers))
+    else:
+        cursor.execute("""
+            SELECT nextval(pg_get_serial_sequence('courses', 'id')),
+                   ARRAY(SELECT nextval(pg_get_serial_sequence('lessons', 'id')) FROM generate_series(1, %s)),
+                   ARRAY(SELECT nextval(pg_get_serial_sequence('questions', 'id')) FROM generate_series(1, %s)),
+                   ARRAY(SELECT nextval(pg_get_serial_sequence('answers', 'id')) FROM generate_series(1, %s))
+        """, (len(lessons), len(questions), len(answers)))
+        course_id, lesson_ids, question_ids, answer_ids = cursor.fetchone()
+
+    lesson_rows, question_rows, answer_rows, id_map = [], [], [], []
+    question_ids, answer_ids = iter(question_ids), iter(answer_ids)
+
+    for lesson_id, lesson in zip(lesson_ids, lessons):
+        lesson_rows.append((lesson_id, course_id, lesson.get('title'), lesson.get('video_url'), lesson.get('lesson_text')))
+        lesson_map = {"id": lesson_id, "questions": []}
+
+        for question in lesson.get('questions', []):
+            question_id = next(question_ids)
+            ids = []
+            correct_answer_id = None
+            for answer in question.get('answers', []):
+                answer_id = next(answer_ids)
+                answer_rows.append((answer_id, question_id, answer.get('text')))
+                ids.append(answer_id)
+                if answer.get('is_correct', False):
+                    correct_answer_id = answer_id
+
+            question_rows.append((question_id, lesson_id, question.get('question_text'), correct_answer_id))
+            lesson_map["questions"].append({
+                "id": question_id,
+                "answer_ids": ids,
+                "correct_answer_id": correct_answer_id
+            })
+
+        id_map.append(lesson_map)
+
+    cursor.execute(
+        "INSERT INTO courses (id, title, description, language) VALUES (%s, %s, %s, %s)",
+        (course_id, data.get('title'), data.get('description'), data.get('language', 'General'))
+    )
+    if lesson_rows:
+        insert_rows(cursor, "INSERT INTO lessons (id, course_id, title, video_url, lesson_text) VALUES %s", lesson_rows)
+    if question_rows:
+        insert_rows(cursor, "INSERT INTO questions (id, lesson_id, question_text, correct_answer_id) VALUES %s", question_rows)
+    if answer_rows:
+        insert_rows(cursor, "INSERT INTO answers (id, question_id, answer_text) VALUES %s", answer_rows)
+    bump_version(cursor, "catalog")
+    conn.commit()
+
+    return jsonify({"message": "Course imported successfully", "course_id": course_id, "lessons": id_map}), 201
+
+
+def _validate_course_tree(data):
+    if not isinstance(data, dict):
+        return "Body must be a JSON object"
+    if not data.get('title'):
+        return "Missing course title"
+    lessons = data.get('lessons', [])
+    if not isinstance(lessons, list):
+        return "lessons must be a list"
+    for i, lesson in enumerate(lessons):
+        if not isinstance(lesson, dict) or not lesson.get('title'):
+            return f"lessons[{i}] needs a title"
+        questions = lesson.get('questions', [])
+        if not isinstance(questions, list):
+            return f"lessons[{i}].questions must be a list"
+        for j, question in enumerate(questions):
+            if not isinstance(question, dict) or not question.get('question_text'):
+                return f"lessons[{i}].questions[{j}] needs question_text"
+            answers = question.get('answers', [])
+            if not isinstance(answers, list):
+                return f"lessons[{i}].questions[{j}].answers must be a list"
+            for k, answer in enumerate(answers):
+                if not isinstance(answer, dict) or 'text' not in answer:
+                    return f"lessons[{i}].questions[{j}].answers[{k}] needs text"
+    return None
+
 # ----------------------------------------
 # ✅ View all courses
 # ----------------------------------------
 @course_bp.route('/courses', methods=['GET'])
+@conditional(lambda: "catalog")
 def get_courses():
+    limit, after = page_args()
+    fields, error = _requested_fields(COURSE_FIELDS, COURSE_FIELDS)
+    if error:
+        return jsonify({"error": error}), 400
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM courses")
-    rows = cursor.fetchall()
-    conn.close()
+    # id is always selected first: it is the pagination key
+    cursor.execute(
+        f"SELECT id, {', '.join(fields)} FROM courses WHERE id > %s ORDER BY id LIMIT %s",
+        (after[0], limit + 1)
+    )
+    rows, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[0],))
 
-    courses = [{
-        "id": row[0],
-        "title": row[1],
-        "description": row[2],
-        "language": row[3] if len(row) > 3 else "General"
-    } for row in rows]
+    courses = [dict(zip(fields, row[1:])) for row in rows]
 
-    return jsonify(courses)
+    return page_response(courses, next_cursor)
 
 # ----------------------------------------
 # ✅ Add lesson to a course
 # ----------------------------------------
 @course_bp.route('/lessons', methods=['POST'])
+@require_auth(role="admin")
 def add_lesson():
     data = request.get_json()
     course_id = data.get('course_id')
@@ -78,11 +201,11 @@ def add_lesson():
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO lessons (course_id, title, video_url, lesson_text) VALUES (%s, %s, %s, %s)",
+        "INSERT INTO lessons (course_id, title, video_url, lesson_text) VALUES (%s, %s, %s, %s) RETURNING course_id",
         (course_id, title, video_url, lesson_text)
     )
+    bump_version(cursor, f"course:{cursor.fetchone()[0]}")
     conn.commit()
-    conn.close()
 
     return jsonify({"message": "Lesson added successfully"}), 201
 
@@ -90,72 +213,211 @@ def add_lesson():
 # ✅ View lessons for a course
 # ----------------------------------------
 @course_bp.route('/courses/<int:course_id>/lessons', methods=['GET'])
+@conditional(lambda course_id: f"course:{course_id}")
 def get_lessons(course_id):
+    limit, after = page_args()
+    fields, error = _requested_fields(LESSON_FIELDS, LESSON_LIST_DEFAULT_FIELDS)
+    if error:
+        return jsonify({"error": error}), 400
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM lessons WHERE course_id = %s", (course_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    cursor.execute(
+        f"SELECT id, {', '.join(fields)} FROM lessons WHERE course_id = %s AND id > %s ORDER BY id LIMIT %s",
+        (course_id, after[0], limit + 1)
+    )
+    rows, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[0],))
+
+    lessons = [dict(zip(fields, row[1:])) for row in rows]
+
+    return page_response(lessons, next_cursor)
+
+# ----------------------------------------
+# ✅ View a single lesson with its full text
+# ----------------------------------------
+@course_bp.route('/lessons/<int:lesson_id>', methods=['GET'])
+@conditional(lambda lesson_id: f"lesson:{lesson_id}")
+def get_lesson(lesson_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, course_id, title, video_url, lesson_text FROM lessons WHERE id = %s",
+        (lesson_id,)
+    )
+    row = cursor.fetchone()
+
+    if not row:
+        return jsonify({"error": "Lesson not found"}), 404
+    return jsonify(dict(zip(LESSON_FIELDS, row)))
 
-    lessons = [{
-        "id": row[0],
-        "course_id": row[1],
-        "title": row[2],
-        "video_url": row[3],
-        "lesson_text": row[4]
-    } for row in rows]
 
-    return jsonify(lessons)
+def _requested_fields(allowed, default):
+    # ?fields=id,title -> (["id", "title"], None); unknown names are a 400
+    raw = request.args.get('fields')
+    if not raw:
+        return default, None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        return None, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+    return fields, None
 
 # ----------------------------------------
 # ✅ Delete a course (with cascading deletes)
 # ----------------------------------------
 @course_bp.route('/courses/<int:course_id>', methods=['DELETE'])
+@require_auth(role="admin")
 def delete_course(course_id):
     conn = get_db()
     cursor = conn.cursor()
 
-    # 1. Get all lesson IDs for this course
-    cursor.execute("SELECT id FROM lessons WHERE course_id = %s", (course_id,))
+    # ?mode=background deletes in small transactions after responding, so a
+    # very large course never holds locks long enough to stall quiz traffic.
+    if request.args.get('mode') == 'background':
+        cursor.execute("SELECT 1 FROM courses WHERE id = %s", (course_id,))
+        if cursor.fetchone() is None:
+            return jsonify({"error": "Course not found"}), 404
+        with _deleting_lock:
+            if course_id in _deleting:
+                return jsonify({"message": f"Course {course_id} deletion already in progress"}), 202
+            if len(_deleting) >= DELETE_MAX_RUNNING:
+                return jsonify({"error": "Too many course deletions running, please try again later."}), 503
+            _deleting.add(course_id)
+        threading.Thread(target=_delete_course_in_background, args=(course_id,), daemon=True).start()
+        return jsonify({"message": f"Course {course_id} deletion started"}), 202
+
+    # Lessons cascade to questions, answers, attempts, progress, points and comments
+    cursor.execute("DELETE FROM lessons WHERE course_id = %s RETURNING id", (course_id,))
     lesson_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+    if cursor.rowcount == 0:
+        conn.rollback()
+        return jsonify({"error": "Course not found"}), 404
+    bump_version(cursor, "catalog", f"course:{course_id}", *(f"lesson:{i}" for i in lesson_ids))
+    invalidate(cursor, "quiz", *lesson_ids)
 
-    # 2. Delete questions linked to those lessons
+    conn.commit()
     for lesson_id in lesson_ids:
-        cursor.execute("DELETE FROM questions WHERE lesson_id = %s", (lesson_id,))
-        cursor.execute("DELETE FROM user_progress WHERE lesson_id = %s", (lesson_id,))
-        cursor.execute("DELETE FROM user_points WHERE lesson_id = %s", (lesson_id,))
-        cursor.execute("DELETE FROM comments WHERE lesson_id = %s", (lesson_id,))
+        quiz_cache.pop(lesson_id)
+
+    return jsonify({"message": f"Course {course_id} and related data deleted"}), 200
 
-    # 3. Delete lessons
-    cursor.execute("DELETE FROM lessons WHERE course_id = %s", (course_id,))
 
-    # 4. Finally, delete the course
-    cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+# Leaf tables first, so each cascading delete below has little left to do.
+# Every statement removes one chunk of rows belonging to a single lesson.
+_LESSON_CHUNK_DELETES = [
+    """DELETE FROM user_attempts WHERE ctid = ANY(ARRAY(
+           SELECT ua.ctid FROM user_attempts ua JOIN questions q ON q.id = ua.question_id
+           WHERE q.lesson_id = %(lesson_id)s LIMIT %(chunk)s))""",
+    """DELETE FROM answers WHERE id IN (
+           SELECT a.id FROM answers a JOIN questions q ON q.id = a.question_id
+           WHERE q.lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+    """DELETE FROM questions WHERE id IN (
+           SELECT id FROM questions WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+    """DELETE FROM comments WHERE id IN (
+           SELECT id FROM comments WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+    """DELETE FROM user_progress WHERE ctid = ANY(ARRAY(
+           SELECT ctid FROM user_progress WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s))""",
+    """DELETE FROM user_points WHERE ctid = ANY(ARRAY(
+           SELECT ctid FROM user_points WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s))""",
+]
 
-    conn.commit()
-    conn.close()
+_DELETE_LOCK_SPACE = 8  # first key of the course-delete advisory locks
 
-    return jsonify({"message": f"Course {course_id} and related data deleted"}), 200
+if DIALECT == "sqlite":
+    # SQLite has rowid where Postgres has ctid
+    _LESSON_CHUNK_DELETES = [
+        """DELETE FROM user_attempts WHERE rowid IN (
+               SELECT ua.rowid FROM user_attempts ua JOIN questions q ON q.id = ua.question_id
+               WHERE q.lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+        *_LESSON_CHUNK_DELETES[1:4],
+        """DELETE FROM user_progress WHERE rowid IN (
+               SELECT rowid FROM user_progress WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+        """DELETE FROM user_points WHERE rowid IN (
+               SELECT rowid FROM user_points WHERE lesson_id = %(lesson_id)s LIMIT %(chunk)s)""",
+    ]
+
+
+def _delete_course_in_background(course_id):
+    try:
+        log.info("course %s: background delete started", course_id)
+        if _delete_course_in_chunks(course_id):
+            log.info("course %s: background delete finished", course_id)
+        else:
+            log.info("course %s: background delete already running in another worker", course_id)
+    except Exception:
+        log.exception("course %s: background delete failed; DELETE it again to resume", course_id)
+    finally:
+        with _deleting_lock:
+            _deleting.discard(course_id)
+
+
+def _delete_course_in_chunks(course_id):
+    # The course row goes last, so a delete cut short (an error, or the
+    # worker exiting and taking this daemon thread with it) leaves the
+    # course listed with whatever content remains; calling the endpoint
+    # again picks up from there. On Postgres a session advisory lock keeps
+    # other workers from deleting the same course at once, and is released
+    # with the connection if the worker dies. Returns False if it was held.
+    with connection() as conn:
+        cursor = conn.cursor()
+        if DIALECT == "postgres":
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", (_DELETE_LOCK_SPACE, course_id))
+            if not cursor.fetchone()[0]:
+                conn.rollback()
+                return False
+        try:
+            cursor.execute("SELECT id FROM lessons WHERE course_id = %s", (course_id,))
+            lesson_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+
+            for lesson_id in lesson_ids:
+                quiz_cache.pop(lesson_id)
+                params = {"lesson_id": lesson_id, "chunk": DELETE_CHUNK_SIZE}
+                for statement in _LESSON_CHUNK_DELETES:
+                    while True:
+                        cursor.execute(statement, params)
+                        deleted = cursor.rowcount
+                        conn.commit()
+                        if deleted < DELETE_CHUNK_SIZE:
+                            break
+                        time.sleep(DELETE_CHUNK_PAUSE)
+                cursor.execute("DELETE FROM lessons WHERE id = %s", (lesson_id,))
+                bump_version(cursor, f"course:{course_id}", f"lesson:{lesson_id}")
+                invalidate(cursor, "quiz", lesson_id)
+                conn.commit()
+
+            cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+            bump_version(cursor, "catalog", f"course:{course_id}")
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if DIALECT == "postgres":
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", (_DELETE_LOCK_SPACE, course_id))
+                conn.commit()
+            cursor.close()
 
 
 # ----------------------------------------
 # ✅ Delete a lesson (and related data)
 # ----------------------------------------
 @course_bp.route('/lessons/<int:lesson_id>', methods=['DELETE'])
+@require_auth(role="admin")
 def delete_lesson(lesson_id):
     conn = get_db()
     cursor = conn.cursor()
 
-    # Delete dependent records first (order matters!)
-    cursor.execute("DELETE FROM questions WHERE lesson_id = %s", (lesson_id,))
-    cursor.execute("DELETE FROM user_progress WHERE lesson_id = %s", (lesson_id,))
-    cursor.execute("DELETE FROM user_points WHERE lesson_id = %s", (lesson_id,))
-    cursor.execute("DELETE FROM comments WHERE lesson_id = %s", (lesson_id,))
-
-    # Then delete the lesson itself
-    cursor.execute("DELETE FROM lessons WHERE id = %s", (lesson_id,))
+    # Questions, answers, attempts, progress, points and comments cascade
+    cursor.execute("DELETE FROM lessons WHERE id = %s RETURNING course_id", (lesson_id,))
+    lesson = cursor.fetchone()
+    if lesson:
+        bump_version(cursor, f"course:{lesson[0]}", f"lesson:{lesson_id}")
+        invalidate(cursor, "quiz", lesson_id)
 
     conn.commit()
-    conn.close()
+    quiz_cache.pop(lesson_id)
 
     return jsonify({"message": f"Lesson {lesson_id} and its related data deleted"}), 200
@@ -1,21 +1,34 @@
 # backend/routes/quiz_routes.py
 
-from flask import Blueprint, request, jsonify
-import psycopg2
 import os
 
+from flask import Blueprint, request, jsonify
+from db import get_db
+from cache import LRUCache
+from live import broker, cache_epoch, invalidate, register_cache
+from pagination import page_args, paginate, page_response
+from users import lookup_user
+from tokens import require_auth
+from grading import grade_answer, grade_quiz
+from progress import percent
+
 quiz_bp = Blueprint('quiz', __name__)
 
-def get_db():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("DB_PORT", 5432)
-    )
+# lesson_id -> assembled quiz. Every write that changes a lesson's questions
+# or answers calls invalidate() in its transaction, and each worker's
+# listener evicts the entry on commit (see live.py), so a hit needs no
+# database round trip. The TTL only bounds memory held by idle lessons.
+quiz_cache = LRUCache(
+    maxsize=int(os.getenv("QUIZ_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("QUIZ_CACHE_TTL", "60")),
+)
+register_cache("quiz", quiz_cache, int)
+
+MAX_QUIZ_ANSWERS = int(os.getenv("MAX_QUIZ_ANSWERS", "200"))
+
 
 @quiz_bp.route('/questions', methods=['POST'])
+@require_auth(role="admin")
 def add_question():
     data = request.get_json()
     lesson_id = data.get('lesson_id')
@@ -23,14 +36,16 @@ def add_question():
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO questions (lesson_id, question_text) VALUES (%s, %s) RETURNING id", (lesson_id, question_text))
-    question_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO questions (lesson_id, question_text) VALUES (%s, %s) RETURNING id, lesson_id", (lesson_id, question_text))
+    question_id, lesson_id = cursor.fetchone()
+    invalidate(cursor, "quiz", lesson_id)
     conn.commit()
-    conn.close()
+    quiz_cache.pop(lesson_id)
 
     return jsonify({"message": "Question added", "question_id": question_id}), 201
 
 @quiz_bp.route('/answers', methods=['POST'])
+@require_auth(role="admin")
 def add_answers():
     data = request.get_json()
     question_id = data.get('question_id')
@@ -48,10 +63,16 @@ def add_answers():
             correct_answer_id = answer_id
 
     if correct_answer_id:
-        cursor.execute("UPDATE questions SET correct_answer_id = %s WHERE id = %s", (correct_answer_id, question_id))
+        cursor.execute("UPDATE questions SET correct_answer_id = %s WHERE id = %s RETURNING lesson_id", (correct_answer_id, question_id))
+    else:
+        cursor.execute("SELECT lesson_id FROM questions WHERE id = %s", (question_id,))
+    question = cursor.fetchone()
+    if question:
+        invalidate(cursor, "quiz", question[0])
 
     conn.commit()
-    conn.close()
+    if question:
+        quiz_cache.pop(question[0])
     return jsonify({"message": "Answers added"}), 201
 
 @quiz_bp.route('/submit-answer', methods=['POST'])
@@ -64,42 +85,64 @@ def submit_answer():
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-    user_row = cursor.fetchone()
-    if not user_row:
-        return jsonify({"error": "User not found"}), 404
-    user_id = user_row[0]
+    # Lookup, attempt upsert and point award happen atomically in the database
+    # (see grading.py)
+    outcome, attempts, points = grade_answer(cursor, username, question_id, selected_answer_id)
+    conn.commit()
 
-    cursor.execute("SELECT correct_answer_id FROM questions WHERE id = %s", (question_id,))
-    correct_row = cursor.fetchone()
-    if not correct_row:
+    if outcome == "no_user":
+        return jsonify({"error": "User not found"}), 404
+    if outcome == "no_question":
         return jsonify({"error": "Question not found"}), 404
-    correct_answer_id = correct_row[0]
+    if outcome == "already_correct":
+        return jsonify({"message": "Already answered correctly"}), 200
+    if outcome == "correct":
+        return jsonify({"correct": True, "message": "Correct answer!", "points_awarded": points})
+
+    return jsonify({"correct": False, "message": "Incorrect. Try again.", "attempts": attempts})
 
-    cursor.execute("SELECT attempts, is_correct FROM user_attempts WHERE user_id = %s AND question_id = %s", (user_id, question_id))
-    attempt = cursor.fetchone()
+@quiz_bp.route('/submit-quiz', methods=['POST'])
+def submit_quiz():
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    lesson_id = data.get('lesson_id')
+    answers = data.get('answers')
 
-    if attempt and attempt[1]:
-        return jsonify({"message": "Already answered correctly"}), 200
+    if not isinstance(lesson_id, int) or not isinstance(answers, list) or not answers:
+        return jsonify({"error": "lesson_id and a non-empty answers list are required"}), 400
+    if len(answers) > MAX_QUIZ_ANSWERS:
+        return jsonify({"error": f"At most {MAX_QUIZ_ANSWERS} answers per submission"}), 400
+    if not all(isinstance(a, dict) and isinstance(a.get('question_id'), int)
+               and isinstance(a.get('answer_id'), (int, type(None))) for a in answers):
+        return jsonify({"error": "Each answer needs an integer question_id and answer_id"}), 400
 
-    if attempt:
-        attempts = attempt[0] + 1
-        cursor.execute("UPDATE user_attempts SET attempts = %s WHERE user_id = %s AND question_id = %s", (attempts, user_id, question_id))
-    else:
-        attempts = 1
-        cursor.execute("INSERT INTO user_attempts (user_id, question_id, attempts) VALUES (%s, %s, %s)", (user_id, question_id, attempts))
-
-    if selected_answer_id == correct_answer_id:
-        cursor.execute("UPDATE user_attempts SET is_correct = TRUE WHERE user_id = %s AND question_id = %s", (user_id, question_id))
-        points = 10 if attempts == 1 else 7 if attempts == 2 else 5 if attempts == 3 else 0
-        cursor.execute("UPDATE users SET total_points = total_points + %s WHERE id = %s", (points, user_id))
-        conn.commit()
-        conn.close()
-        return jsonify({"correct": True, "message": "Correct answer!", "points_awarded": points})
+    conn = get_db()
+    cursor = conn.cursor()
 
+    # Every answer is graded with submit-answer's rules in one transaction;
+    # the correct answers are loaded in one query (see grading.py)
+    graded = grade_quiz(cursor, username, lesson_id,
+                        [(a['question_id'], a.get('answer_id')) for a in answers])
     conn.commit()
-    conn.close()
-    return jsonify({"correct": False, "message": "Incorrect. Try again.", "attempts": attempts})
+
+    if graded is None:
+        return jsonify({"error": "User not found"}), 404
+
+    results, total = [], 0
+    for question_id, outcome, attempts, points in graded:
+        if outcome == "no_question":
+            results.append({"question_id": question_id, "error": "Question not found"})
+        elif outcome == "already_correct":
+            results.append({"question_id": question_id, "message": "Already answered correctly"})
+        elif outcome == "correct":
+            total += points
+            results.append({"question_id": question_id, "correct": True, "message": "Correct answer!",
+                            "points_awarded": points})
+        else:
+            results.append({"question_id": question_id, "correct": False, "message": "Incorrect. Try again.",
+                            "attempts": attempts})
+
+    return jsonify({"lesson_id": lesson_id, "results": results, "total_points_awarded": total})
 
 @quiz_bp.route('/questions/<int:question_id>/answers', methods=['GET'])
 def get_answers_for_question(question_id):
@@ -107,36 +150,48 @@ def get_answers_for_question(question_id):
     cursor = conn.cursor()
     cursor.execute("SELECT id, answer_text FROM answers WHERE question_id = %s", (question_id,))
     rows = cursor.fetchall()
-    conn.close()
     return jsonify([{"id": row[0], "text": row[1]} for row in rows])
 
 @quiz_bp.route('/quiz/<int:lesson_id>', methods=['GET'])
 def get_quiz_by_lesson(lesson_id):
+    # Only trusted while this worker hears invalidations (see live.py)
+    cacheable = broker.listening()
+    if cacheable:
+        result = quiz_cache.get(lesson_id)
+        if result is not None:
+            return jsonify(result)
+    epoch = cache_epoch()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, question_text FROM questions WHERE lesson_id = %s", (lesson_id,))
-    questions = cursor.fetchall()
-    if not questions:
-        conn.close()
-        return jsonify([])
+    cursor.execute("""
+        SELECT q.id, q.question_text, a.id, a.answer_text
+        FROM questions q
+        LEFT JOIN answers a ON a.question_id = q.id
+        WHERE q.lesson_id = %s
+        ORDER BY q.id, a.id
+    """, (lesson_id,))
+    rows = cursor.fetchall()
 
     result = []
-    for qid, qtext in questions:
-        cursor.execute("SELECT id, answer_text FROM answers WHERE question_id = %s", (qid,))
-        answers = cursor.fetchall()
-        result.append({"id": qid, "question": qtext, "answers": [{"id": a[0], "text": a[1]} for a in answers]})
+    for qid, qtext, aid, atext in rows:
+        if not result or result[-1]["id"] != qid:
+            result.append({"id": qid, "question": qtext, "answers": []})
+        if aid is not None:
+            result[-1]["answers"].append({"id": aid, "text": atext})
 
-    conn.close()
+    if cacheable and epoch == cache_epoch():
+        quiz_cache.set(lesson_id, result)
     return jsonify(result)
 
 @quiz_bp.route('/user-progress/<username>', methods=['GET'])
 def get_user_progress(username):
+    limit, after = page_args()
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-    user = cursor.fetchone()
+    user = lookup_user(cursor, username)
     if not user:
-        conn.close()
         return jsonify([])
     user_id = user[0]
     cursor.execute("""
@@ -144,31 +199,106 @@ def get_user_progress(username):
         FROM user_attempts ua
         JOIN questions q ON ua.question_id = q.id
         JOIN lessons l ON q.lesson_id = l.id
-        WHERE ua.user_id = %s
-    """, (user_id,))
-    results = cursor.fetchall()
-    conn.close()
-    return jsonify([{
+        WHERE ua.user_id = %s AND ua.question_id > %s
+        ORDER BY ua.question_id
+        LIMIT %s
+    """, (user_id, after[0], limit + 1))
+    results, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[0],))
+    return page_response([{
         "question_id": row[0],
         "attempts": row[1],
         "is_correct": bool(row[2]),
         "lesson_title": row[3]
-    } for row in results])
+    } for row in results], next_cursor)
+
+def _course_summary(course_id, title, lessons, questions, completed, correct, points, badge):
+    completed, correct = completed or 0, correct or 0
+    return {
+        "course_id": course_id,
+        "title": title,
+        "percent_complete": percent(correct, questions),
+        "lessons_completed": completed,
+        "lessons_total": lessons,
+        "questions_correct": correct,
+        "questions_total": questions,
+        "points": points or 0,
+        "badge": badge,
+    }
+
+# Precomputed per-course rollups (see progress.py), one row per course started
+@quiz_bp.route('/user-progress/<username>/courses', methods=['GET'])
+def get_user_course_progress(username):
+    limit, after = page_args()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    user = lookup_user(cursor, username)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    cursor.execute("""
+        SELECT c.id, c.title, c.quiz_lesson_count, c.question_count,
+               cp.lessons_completed, cp.questions_correct, cp.points, cp.badge
+        FROM course_progress cp
+        JOIN courses c ON c.id = cp.course_id
+        WHERE cp.user_id = %s AND cp.course_id > %s
+        ORDER BY cp.course_id
+        LIMIT %s
+    """, (user[0], after[0], limit + 1))
+    rows, next_cursor = paginate(cursor.fetchall(), limit, key=lambda row: (row[0],))
+    return page_response([_course_summary(*row) for row in rows], next_cursor)
+
+@quiz_bp.route('/user-progress/<username>/courses/<int:course_id>', methods=['GET'])
+def get_user_course_detail(username, course_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    user = lookup_user(cursor, username)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    cursor.execute("""
+        SELECT c.id, c.title, c.quiz_lesson_count, c.question_count,
+               cp.lessons_completed, cp.questions_correct, cp.points, cp.badge
+        FROM courses c
+        LEFT JOIN course_progress cp ON cp.course_id = c.id AND cp.user_id = %s
+        WHERE c.id = %s
+    """, (user[0], course_id))
+    row = cursor.fetchone()
+    if row is None:
+        return jsonify({"error": "Course not found"}), 404
+    result = _course_summary(*row)
+
+    cursor.execute("""
+        SELECT l.id, l.title, l.question_count, up.questions_correct, up.is_completed, pt.points, pt.badge
+        FROM lessons l
+        LEFT JOIN user_progress up ON up.user_id = %s AND up.lesson_id = l.id
+        LEFT JOIN user_points pt ON pt.user_id = %s AND pt.lesson_id = l.id
+        WHERE l.course_id = %s
+        ORDER BY l.id
+    """, (user[0], user[0], course_id))
+    result["lessons"] = [{
+        "lesson_id": lesson_id,
+        "title": title,
+        "percent_complete": percent(correct or 0, questions),
+        "questions_correct": correct or 0,
+        "questions_total": questions,
+        "is_completed": bool(completed),
+        "points": points or 0,
+        "badge": badge,
+    } for lesson_id, title, questions, correct, completed, points, badge in cursor.fetchall()]
+    return jsonify(result)
 
 @quiz_bp.route('/questions/<int:question_id>/delete', methods=['DELETE'])
+@require_auth(role="admin")
 def delete_question(question_id):
     conn = get_db()
     cursor = conn.cursor()
 
-    # First delete answers linked to this question
-    cursor.execute("DELETE FROM answers WHERE question_id = %s", (question_id,))
-    
-    # Then delete any user attempts related to this question
-    cursor.execute("DELETE FROM user_attempts WHERE question_id = %s", (question_id,))
-    
-    # Finally delete the question
-    cursor.execute("DELETE FROM questions WHERE id = %s", (question_id,))
+    # Answers and user attempts cascade with the question
+    cursor.execute("DELETE FROM questions WHERE id = %s RETURNING lesson_id", (question_id,))
+    question = cursor.fetchone()
+    if question:
+        invalidate(cursor, "quiz", question[0])
 
     conn.commit()
-    conn.close()
+    if question:
+        quiz_cache.pop(question[0])
     return jsonify({"message": "Question deleted successfully!"})
@@ -0,0 +1,191 @@
+# backend/sqlite_db.py
+#
+# Embedded SQLite backend, selected with DB_BACKEND=sqlite (see db.py) for
+# single-node installs and fast local test/benchmark runs. Connections are
+# wrapped to look like the psycopg2 ones the routes already use: queries
+# keep psycopg2's %s / %(name)s placeholders and Postgres-style ::type casts,
+# which are rewritten here, and the pool's transaction checks keep working.
+# Statements SQLite cannot express at all are branched on db.DIALECT at the
+# call site.
+
+import datetime
+import functools
+import re
+import sqlite3
+import time
+
+from psycopg2 import extensions
+
+import metrics
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer; synchronous=NORMAL is durable across application crashes in WAL
+# mode and only risks the last commits on power loss.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",
+    "cache_size": "-16000",        # KiB, i.e. 16 MB of page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": str(128 * 1024 * 1024),
+}
+
+_PLACEHOLDERS = re.compile(r"%\((\w+)\)s|%s|%%|::\w+(?:\[\])?")
+
+
+def _placeholder(match):
+    token = match.group(0)
+    if token == "%s":
+        return "?"
+    if token == "%%":
+        return "%"
+    if token.startswith("::"):
+        return ""  # SQLite is dynamically typed; casts are dropped
+    return ":" + match.group(1)
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    return _PLACEHOLDERS.sub(_placeholder, sql)
+
+
+# Timestamps are stored as UTC text in CURRENT_TIMESTAMP's format, so they
+# sort correctly as strings and read back as aware datetimes like TIMESTAMPTZ.
+def _adapt_datetime(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(" ")
+
+
+def _convert_datetime(raw):
+    value = datetime.datetime.fromisoformat(raw.decode())
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_datetime)
+sqlite3.register_converter("BOOLEAN", lambda raw: raw not in (b"0", b""))
+
+
+class Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.itersize = None  # accepted for psycopg2 named-cursor compatibility
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(translate(sql), params or ())
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started, self._cursor.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(translate(sql), seq_of_params)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started, self._cursor.rowcount)
+        return self
+
+    # sqlite3 reports rowcount -1 for SELECTs, so returned rows are counted here
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        metrics.observe_rows(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        metrics.observe_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        metrics.observe_rows(len(rows))
+        return rows
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.closed = 0
+
+    def cursor(self, name=None):
+        # SQLite cursors already step through results lazily, so a named
+        # (server-side) cursor is just a regular one.
+        return Cursor(self._conn.cursor())
+
+    def executescript(self, script):
+        self._conn.executescript(script)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = 1
+
+    def get_transaction_status(self):
+        if self._conn.in_transaction:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+
+def connect(path):
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return Connection(conn)
+
+
+def insert_rows(cursor, sql, rows, fetch=False):
+    # Counterpart of psycopg2.extras.execute_values: "... VALUES %s"
+    placeholders = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+    sql = sql.replace("VALUES %s", "VALUES " + placeholders)
+    if not fetch:
+        cursor.executemany(sql, rows)
+        return None
+    # executemany cannot return rows; still a single transaction either way
+    results = []
+    for row in rows:
+        cursor.execute(sql, row)
+        results.append(cursor.fetchone())
+    return results
+
+
+def reserve_ids(cursor, table, count):
+    # Counterpart of nextval(): advance the AUTOINCREMENT counter by count.
+    # The first write takes SQLite's write lock, so reservations never overlap.
+    cursor.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT %s, COALESCE((SELECT MAX(rowid) FROM """ + table + """), 0)
+        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)
+    """, (table, table))
+    cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s RETURNING seq", (count, table))
+    last = cursor.fetchone()[0]
+    return list(range(last - count + 1, last + 1))
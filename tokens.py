@@ -0,0 +1,85 @@
+# backend/tokens.py
+#
+# Signed, expiring bearer tokens issued by /auth/login. A token carries the
+# user's id, username and role, so privileged routes authorize from the
+# signature alone instead of re-reading users.role. Revocation is an
+# in-memory denylist per worker: individual tokens (logout) and every token
+# a user was issued before a cut-off (account deleted).
+
+import functools
+import os
+import secrets
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+TOKEN_TTL = int(os.getenv("TOKEN_TTL", str(24 * 3600)))
+_SALT = "fcc-auth-token"
+
+_lock = threading.Lock()
+_revoked_tokens = {}   # jti -> time after which the entry can be dropped
+_revoked_users = {}    # user_id -> tokens issued at or before this time are invalid
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt=_SALT)
+
+
+def issue_token(user_id, username, role):
+    claims = {"uid": user_id, "sub": username, "role": role, "jti": secrets.token_urlsafe(12)}
+    return _serializer().dumps(claims)
+
+
+def verify_token(token):
+    try:
+        claims, issued_at = _serializer().loads(token, max_age=TOKEN_TTL, return_timestamp=True)
+    except (BadSignature, SignatureExpired):
+        return None
+
+    with _lock:
+        if claims.get("jti") in _revoked_tokens:
+            return None
+        revoked_at = _revoked_users.get(claims.get("uid"))
+    if revoked_at is not None and issued_at.timestamp() <= revoked_at:
+        return None
+    return claims
+
+
+def revoke_token(claims):
+    now = time.time()
+    with _lock:
+        _revoked_tokens[claims["jti"]] = now + TOKEN_TTL
+        for jti in [jti for jti, expires in _revoked_tokens.items() if expires < now]:
+            del _revoked_tokens[jti]
+
+
+def revoke_user(user_id):
+    with _lock:
+        _revoked_users[user_id] = time.time()
+
+
+def current_user():
+    # Claims of the request's bearer token, or None
+    if "token_claims" not in g:
+        header = request.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        g.token_claims = verify_token(token.strip()) if scheme.lower() == "bearer" and token else None
+    return g.token_claims
+
+
+def require_auth(role=None):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            claims = current_user()
+            if claims is None:
+                response = jsonify({"error": "A valid login token is required"})
+                response.headers["WWW-Authenticate"] = "Bearer"
+                return response, 401
+            if role and claims.get("role") != role:
+                return jsonify({"error": f"Only {role}s can do this"}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
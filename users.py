@@ -0,0 +1,40 @@
+# backend/users.py
+#
+# username -> (id, role) cache shared by the route modules, so per-user
+# reads skip the `SELECT id FROM users WHERE username = %s` round trip.
+# Misses are not cached (a new registration resolves immediately). Renames
+# and deletes call invalidate() in their transaction, so every worker drops
+# the old mapping on commit (see live.py), and forget() on this worker.
+
+import os
+
+from cache import LRUCache
+from live import broker, cache_epoch, register_cache
+
+user_cache = LRUCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+register_cache("user", user_cache)
+
+
+def lookup_user(cursor, username):
+    # Returns (id, role), or None if there is no such user. The cache is
+    # only trusted while this worker hears invalidations.
+    cacheable = broker.listening()
+    user = user_cache.get(username) if cacheable else None
+    if user is None:
+        epoch = cache_epoch()
+        cursor.execute("SELECT id, role FROM users WHERE username = %s", (username,))
+        user = cursor.fetchone()
+        if user is not None:
+            user = tuple(user)
+            if cacheable and epoch == cache_epoch():
+                user_cache.set(username, user)
+    return user
+
+
+def forget(*usernames):
+    for username in usernames:
+        if username:
+            user_cache.pop(username)